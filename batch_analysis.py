@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+batch_analysis.py
+
+Non-interactive analysis of many chat exports at once. Every export found
+in the given directories / glob patterns is scanned in a process pool;
+per-chat results and a combined summary are written as CSV (or Parquet,
+when pyarrow is installed). A file that fails is reported and skipped.
+
+Usage:
+    python batch_analysis.py exports/
+    python batch_analysis.py "exports/**/*.txt" -a daily authors -o results
+    python batch_analysis.py exports/ --start 01/01/2023 --end 31/12/2023 --format parquet -w 8
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import os
+import sys
+import time
+
+from data_extraction import AGGREGATES, result_rows, scan_chat
+from helpers import date_arg
+
+# --- Configuration ---
+OUTPUT_DIR = "batch_results"
+DEFAULT_AGGREGATES = ["daily", "authors", "author_daily"]
+EXPORT_PATTERN = "*.txt"          # Files picked up when a directory is given
+# ---------------------
+
+SUMMARY_COLUMNS = ["file", "status", "messages", "authors", "days", "first_date", "last_date", "seconds", "error"]
+
+def find_exports(inputs, pattern=EXPORT_PATTERN):
+    """Expands directories (recursively, by pattern) and glob patterns into a sorted list of unique files."""
+    found = set()
+    for item in inputs:
+        path = Path(item).expanduser()
+        if path.is_dir():
+            found.update(p for p in path.rglob(pattern) if p.is_file())
+        elif path.is_file():
+            found.add(path)
+        else:
+            found.update(Path(p) for p in glob.glob(str(path), recursive=True) if os.path.isfile(p))
+    return sorted(found)
+
+# --- Summary ---
+def summarize(results):
+    """Messages / authors / days / date span for the summary table, from whichever aggregates ran."""
+    daily = results.get("daily")
+    authors = results.get("authors")
+    author_daily = results.get("author_daily")
+    if daily is None and author_daily is not None:
+        daily = {d: sum(counts.values()) for d, counts in author_daily.items()}
+    if authors is None and author_daily is not None:
+        authors = {a for counts in author_daily.values() for a in counts}
+    messages = sum(daily.values()) if daily is not None else \
+               sum(authors.values()) if isinstance(authors, dict) else None
+    days = sorted(daily) if daily is not None else []
+    return {
+        "messages": messages,
+        "authors": len(authors) if authors is not None else None,
+        "days": len(days) if daily is not None else None,
+        "first_date": days[0].isoformat() if days else None,
+        "last_date": days[-1].isoformat() if days else None,
+    }
+
+# --- Writers ---
+def write_csv(path, header, rows):
+    with open(path.with_suffix(".csv"), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def write_parquet(path, header, rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(header)}
+    pq.write_table(pa.table(columns), path.with_suffix(".parquet"))
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+# --- Worker ---
+def analyze_export(filepath, output_dir, aggregate_names, start_date, end_date, output_format, use_cache=True):
+    """
+    Runs the aggregates over one export and writes its result tables to
+    output_dir. Runs in a worker process. Returns a summary row.
+    """
+    started = time.perf_counter()
+    row = {"file": str(filepath), "status": "ok"}
+    log = io.StringIO()
+    try:
+        # scan_chat reports errors by printing and returning None
+        with contextlib.redirect_stdout(log):
+            results = scan_chat(filepath, aggregate_names, start_date, end_date, use_cache=use_cache)
+        if results is None:
+            lines = log.getvalue().strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"could not read {filepath}")
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for name, result in results.items():
+            header, rows = result_rows(name, result)
+            WRITERS[output_format](output_dir / name, header, rows)
+        row.update(summarize(results))
+    except Exception as e:
+        row.update(status="failed", error=str(e) or type(e).__name__)
+    row["seconds"] = round(time.perf_counter() - started, 3)
+    return row
+
+def _output_dirs(files, output_dir):
+    """One results folder per export, named after it; same-named exports get a numeric suffix."""
+    used = set()
+    dirs = []
+    for path in files:
+        name = path.stem
+        n = 1
+        while name in used:
+            n += 1
+            name = f"{path.stem}_{n}"
+        used.add(name)
+        dirs.append(Path(output_dir) / name)
+    return dirs
+
+def run_batch(inputs, output_dir=OUTPUT_DIR, aggregate_names=DEFAULT_AGGREGATES, start_date=None, end_date=None,
+              output_format="csv", workers=None, pattern=EXPORT_PATTERN, use_cache=True):
+    """
+    Analyzes every export under inputs with a pool of worker processes
+    (workers=None uses every CPU) and writes the combined summary. With
+    use_cache, each export keeps a parse cache next to it, so the next run
+    over a re-exported chat parses only its new lines.
+    Returns the summary rows, or None if there was nothing to do.
+    """
+    files = find_exports(inputs, pattern)
+    if not files:
+        print("No chat exports found.")
+        return None
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    print(f"Analyzing {len(files)} exports with {workers} workers...")
+
+    started = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_export, path, chat_dir, aggregate_names, start_date, end_date,
+                               output_format, use_cache): path
+                   for path, chat_dir in zip(files, _output_dirs(files, output_dir))}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                row = future.result()
+            except Exception as e: # The worker process itself died
+                row = {"file": str(futures[future]), "status": "failed", "error": str(e) or type(e).__name__}
+            rows.append(row)
+            if row["status"] == "ok":
+                print(f"[{done}/{len(files)}] {row['file']}: {row['messages']} messages ({row['seconds']}s)")
+            else:
+                print(f"[{done}/{len(files)}] {row['file']}: FAILED - {row['error']}")
+
+    rows.sort(key=lambda row: row["file"])
+    WRITERS[output_format](Path(output_dir) / "summary", SUMMARY_COLUMNS,
+                           [[row.get(column) for column in SUMMARY_COLUMNS] for row in rows])
+    failed = sum(row["status"] != "ok" for row in rows)
+    print(f"Done in {time.perf_counter() - started:.1f}s: {len(rows) - failed} succeeded, {failed} failed. "
+          f"Results in '{output_dir}'.")
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze many WhatsApp chat exports in parallel.")
+    parser.add_argument("inputs", nargs="+", help="Export files, directories or glob patterns")
+    parser.add_argument("-a", "--aggregates", nargs="+", default=DEFAULT_AGGREGATES, choices=sorted(AGGREGATES),
+                        help=f"Aggregates to compute (default: {' '.join(DEFAULT_AGGREGATES)})")
+    parser.add_argument("-o", "--output-dir", default=OUTPUT_DIR, help=f"Results folder (default: '{OUTPUT_DIR}')")
+    parser.add_argument("--start", type=date_arg, help="Start date, dd/mm/yyyy")
+    parser.add_argument("--end", type=date_arg, help="End date, dd/mm/yyyy")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv", help="Output format (default: csv)")
+    parser.add_argument("--pattern", default=EXPORT_PATTERN, help=f"File pattern inside directories (default: '{EXPORT_PATTERN}')")
+    parser.add_argument("-w", "--workers", type=int, default=0, help="Worker processes (0: one per CPU, default: 0)")
+    parser.add_argument("--no-cache", action="store_true", help="Scan the exports without reading or writing their parse caches")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            print("Error: --format parquet needs pyarrow (pip install pyarrow).", file=sys.stderr)
+            sys.exit(1)
+    if args.start and args.end and args.start > args.end:
+        print("Error: Start date is after end date.", file=sys.stderr)
+        sys.exit(1)
+
+    rows = run_batch(args.inputs, args.output_dir, args.aggregates, args.start, args.end,
+                     args.format, args.workers or None, args.pattern, not args.no_cache)
+    if rows is None or any(row["status"] != "ok" for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
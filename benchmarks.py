@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+benchmarks.py
+
+Micro-benchmarks for the chat analyzer's hot paths.
+
+Usage:
+    python benchmarks.py parse_line
+    python benchmarks.py parse_line --file "WhatsApp Chat.txt"
+    python benchmarks.py timestamps -n 500000
+    python benchmarks.py startup      # exits with status 1 if over budget
+    python benchmarks.py server -n 1000000
+    python benchmarks.py suite --sizes 10k 1M --trace --json results.json
+"""
+from pathlib import Path
+import argparse
+import datetime
+import gc
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from helpers import parse_line
+
+def parse_line_strptime(line, date_format):
+    """The original parse_line: one strptime call per line. Kept as the baseline."""
+    try:
+        date_str = line.split(',')[0]
+        date_obj = datetime.datetime.strptime(date_str, date_format).date()
+        hyphen_index = line.find(' - ')
+        if hyphen_index == -1:
+            return None, None
+        colon_index = line.find(':', hyphen_index + 3)
+        if colon_index > hyphen_index:
+            return date_obj, line[hyphen_index + 3 : colon_index].strip()
+        return None, None
+    except ValueError:
+        return None, None
+    except IndexError:
+        return None, None
+
+def sample_lines(count, seed=0):
+    """Builds a small in-memory export with user, multi-line and system lines."""
+    rng = random.Random(seed)
+    authors = ["Milind", "Ojou sama", "Ravi"]
+    moment = datetime.datetime(2021, 1, 1, 8, 0)
+    lines = []
+    while len(lines) < count:
+        moment += datetime.timedelta(minutes=rng.randint(0, 90))
+        stamp = moment.strftime("%d/%m/%Y, %H:%M")
+        roll = rng.random()
+        if roll < 0.05:
+            lines.append(f"{stamp} - {rng.choice(authors)} left\n")
+        elif roll < 0.10:
+            lines.append(f"{stamp} - {rng.choice(authors)}: first line\n")
+            lines.append("a continuation line, with a comma\n")
+        else:
+            lines.append(f"{stamp} - {rng.choice(authors)}: message {len(lines)}\n")
+    return lines[:count]
+
+def time_parser(parser, lines, date_format="%d/%m/%Y", repeat=3):
+    """Returns the best lines-per-second over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            parser(line, date_format)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+def bench_parse_line(lines):
+    baseline = time_parser(parse_line_strptime, lines)
+    fast = time_parser(parse_line, lines)
+    print(f"parse_line (strptime): {baseline:>12,.0f} lines/s")
+    print(f"parse_line (cached):   {fast:>12,.0f} lines/s")
+    print(f"speedup:               {fast / baseline:>12.1f}x")
+
+def bench_timestamps(count, seed=0):
+    """Scalar vs batch Unix timestamp -> ISO string conversion (json_cleaner)."""
+    import json_cleaner
+
+    rng = random.Random(seed)
+    timestamps = [rng.randint(1_500_000_000, 1_800_000_000) for _ in range(count)]
+
+    start = time.perf_counter()
+    scalar = [json_cleaner.convert_timestamp_to_iso_string(ts) for ts in timestamps]
+    scalar_rate = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batch = json_cleaner.convert_timestamps_to_iso_strings(timestamps)
+    batch_rate = count / (time.perf_counter() - start)
+
+    assert scalar == batch, "batch conversion differs from the scalar path"
+    print(f"timestamps (per message): {scalar_rate:>12,.0f} messages/s")
+    print(f"timestamps (batch):       {batch_rate:>12,.0f} messages/s")
+    print(f"speedup:                  {batch_rate / scalar_rate:>12.1f}x")
+
+# --- Startup budget ---
+STARTUP_BUDGET_MS = 100         # Wall time for `cli.py --help` and a data-only command on a small chat
+STARTUP_HEAVY_MODULES = ["plotly", "numpy", "pandas", "concurrent.futures.process"]
+
+# Runs cli.main in a fresh interpreter and reports which heavy modules it loaded
+_STARTUP_PROBE = """
+import contextlib, io, json, sys
+sys.path.insert(0, sys.argv[1])
+with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+    import cli
+    try:
+        cli.main(json.loads(sys.argv[2]))
+    except SystemExit:
+        pass
+print(json.dumps(sorted(m for m in json.loads(sys.argv[3]) if m in sys.modules)))
+"""
+
+def time_command(args, repeat=5):
+    """Best wall time in ms of running `python <args>` in a fresh interpreter."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def bench_startup(budget_ms=STARTUP_BUDGET_MS):
+    """
+    Checks cli.py's startup: wall time against the budget and that plotly /
+    numpy are not imported by --help or by data-only commands.
+    Returns True if every check passes.
+    """
+    here = Path(__file__).resolve().parent
+    cli = str(here / "cli.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        chat = Path(tmp) / "chat.txt"
+        chat.write_text("".join(sample_lines(2_000)), encoding="utf-8")
+        commands = {
+            "--help": ["--help"],
+            "daily": ["daily", str(chat)],
+            "authors": ["authors", str(chat)],
+        }
+        ok = True
+        baseline = time_command(["-c", "pass"])
+        print(f"{'python -c pass':<16} {baseline:>8.1f} ms (interpreter only)")
+        for label, argv in commands.items():
+            elapsed = time_command([cli] + argv)
+            probe = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, str(here), json.dumps(argv),
+                                    json.dumps(STARTUP_HEAVY_MODULES)], capture_output=True, text=True)
+            heavy = json.loads(probe.stdout.strip().splitlines()[-1]) if probe.stdout.strip() else ["<probe failed>"]
+            passed = elapsed <= budget_ms and not heavy
+            ok = ok and passed
+            note = f"  loaded: {', '.join(heavy)}" if heavy else ""
+            print(f"{label:<16} {elapsed:>8.1f} ms {'ok' if passed else 'OVER BUDGET'}{note}")
+    print(f"budget: {budget_ms} ms -> {'pass' if ok else 'FAIL'}")
+    return ok
+
+# --- Query service ---
+def bench_server(messages=200_000, requests=2000, seed=0):
+    """
+    Latency of chat_server.py queries on a cached synthetic chat, over one
+    keep-alive connection: first answers (computed from the table) and
+    repeated ones (answer cache). Returns {name: milliseconds}.
+    """
+    import asyncio
+    import http.client
+    import threading
+    import synthetic_chat
+    from chat_server import serve
+
+    def percentile(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_chat.generate_txt(Path(tmp) / "chat.txt", messages, seed)
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        ports = []
+        server = loop.create_task(serve(tmp, port=0, ready=lambda port: (ports.append(port), ready.set())))
+        thread = threading.Thread(target=loop.run_until_complete, args=(asyncio.gather(server, return_exceptions=True),))
+        thread.start()
+        ready.wait()
+
+        conn = http.client.HTTPConnection("127.0.0.1", ports[0])
+        def get(url):
+            start = time.perf_counter()
+            conn.request("GET", url)
+            response = conn.getresponse()
+            response.read()
+            return (time.perf_counter() - start) * 1000
+
+        cold = get("/daily?chat=chat.txt")
+        rng = random.Random(seed)
+        urls = [f"/{endpoint}?chat=chat.txt&start=01/{month:02d}/{year}&end=28/{month:02d}/{year}"
+                for endpoint in ("daily", "authors", "author-daily", "hour-weekday", "author-hour")
+                for year in (2019, 2020) for month in (1, 4, 7, 10)]
+        first = [get(url) for url in urls]
+        repeated = [get(rng.choice(urls)) for _ in range(requests)]
+        conn.close()
+        loop.call_soon_threadsafe(server.cancel)
+        thread.join()
+        loop.close()
+
+    results = {"cold_load": cold, "first_p50": percentile(first, 0.5), "first_p99": percentile(first, 0.99),
+               "repeat_p50": percentile(repeated, 0.5), "repeat_p99": percentile(repeated, 0.99)}
+    print(f"\n{messages:,} messages, {len(urls)} distinct queries, {requests} repeated")
+    for name, value in results.items():
+        print(f"{name:<12} {value:>9.2f} ms")
+    return results
+
+# --- Stage suite ---
+# Every stage runs in a fresh interpreter on synthetic_chat.py data, so peak
+# RSS belongs to that stage alone. Stages that read another stage's output
+# (split reads clean_json's) must come after it.
+SUITE_SIZES = ["10k", "1M", "10M"]
+
+def _size(value):
+    """'10k' -> 10000, '1M' -> 1000000."""
+    units = {"k": 1_000, "m": 1_000_000}
+    value = value.strip().lower()
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def _clear_sidecars(path):
+    """Removes parse caches / indexes / cubes so each stage measures a cold run."""
+    import shutil
+    from helpers import CACHE_SUFFIX, CUBE_SUFFIX, sidecar_path
+    from date_index import INDEX_SUFFIX
+    for suffix in (CUBE_SUFFIX, INDEX_SUFFIX):
+        sidecar_path(path, suffix).unlink(missing_ok=True)
+    shutil.rmtree(sidecar_path(path, CACHE_SUFFIX), ignore_errors=True)
+
+def _stage_parse_line(work):
+    count = 0
+    with open(work / "chat.txt", 'r', encoding='utf-8') as f:
+        for line in f:
+            parse_line(line, "%d/%m/%Y")
+            count += 1
+    return count
+
+def _stage_extract(work):
+    from data_extraction import scan_chat
+    _clear_sidecars(work / "chat.txt")
+    results = scan_chat(work / "chat.txt", ["daily", "authors", "author_daily"], use_cache=False)
+    return sum(results["authors"].values())
+
+def _stage_extract_activity(work):
+    # extract plus the columnar hour x weekday / author x hour aggregates: the difference is their ingest cost
+    from data_extraction import scan_chat
+    _clear_sidecars(work / "chat.txt")
+    results = scan_chat(work / "chat.txt", ["daily", "authors", "author_daily", "hour_weekday", "author_hour"], use_cache=False)
+    return sum(results["authors"].values())
+
+def _stage_tokens(work):
+    from data_extraction import scan_chat
+    _clear_sidecars(work / "chat.txt")
+    scan_chat(work / "chat.txt", ["tokens"])
+    return None
+
+def _stage_conversations(work):
+    from conversations import analyze_chat
+    return analyze_chat(work / "chat.txt").messages
+
+def _stage_message_table(work):
+    from message_table import load_message_table
+    return len(load_message_table(work / "chat.txt"))
+
+def _stage_clean_txt(work):
+    from txt_cleaner import clean_file
+    clean_file(work / "chat.txt", work / "chat_clean.txt")
+    return None
+
+def _stage_clean_json(work):
+    import json_cleaner
+    with open(work / "msgstore.json", 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return len(json_cleaner.process_chat_data(next(iter(data.values()))["messages"]))
+
+def _stage_clean_json_stream(work):
+    import json_cleaner
+    return json_cleaner.process_chat_stream(work / "msgstore.json", work / "formatted.json")
+
+def _stage_split(work):
+    from split_by_date import split_chat_by_day
+    split_chat_by_day(work / "formatted.json", work / "daily", include_year=True)
+    return None
+
+STAGE_MODULES = { # Imported before the clock starts
+    "extract": "data_extraction",
+    "extract_activity": "data_extraction",
+    "tokens": "data_extraction",
+    "conversations": "conversations",
+    "message_table": "message_table",
+    "clean_txt": "txt_cleaner",
+    "clean_json": "json_cleaner",
+    "clean_json_stream": "json_cleaner",
+    "split": "split_by_date",
+}
+
+STAGES = {
+    "parse_line": _stage_parse_line,
+    "extract": _stage_extract,
+    "extract_activity": _stage_extract_activity,
+    "tokens": _stage_tokens,
+    "conversations": _stage_conversations,
+    "message_table": _stage_message_table,
+    "clean_txt": _stage_clean_txt,
+    "clean_json": _stage_clean_json,
+    "clean_json_stream": _stage_clean_json_stream,
+    "split": _stage_split,
+}
+
+def run_stage(name, work, trace=False):
+    """
+    Runs one stage in this process and returns its measurements. Called in
+    a fresh interpreter by bench_suite.
+    """
+    import contextlib
+    import importlib
+    import io
+    import resource
+    import tracemalloc
+
+    work = Path(work)
+    if name in STAGE_MODULES:
+        importlib.import_module(STAGE_MODULES[name])
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    blocks = sys.getallocatedblocks()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = STAGES[name](work)
+    seconds = time.perf_counter() - start
+    result = {
+        "seconds": seconds,
+        "items": items,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "base_rss_mb": rss_before / 1024,
+        "allocated_blocks": sys.getallocatedblocks() - blocks, # Still allocated when the stage ends (caches, leaks)
+        "gc_collections": sum(stat["collections"] for stat in gc.get_stats()) - collections,
+    }
+    if trace:
+        result["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        result["traced_blocks"] = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+    return result
+
+_STAGE_PROBE = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import benchmarks
+print(json.dumps(benchmarks.run_stage(sys.argv[2], sys.argv[3], sys.argv[4] == "1")))
+"""
+
+def bench_suite(sizes, stages=None, trace=False, workdir=None, seed=0):
+    """
+    Generates synthetic inputs for each size and runs every stage on them.
+    Prints throughput (messages/s), peak RSS, the change in allocated
+    memory blocks (sys.getallocatedblocks()), garbage-collector runs and,
+    with trace, tracemalloc's peak and the blocks it still traces at the
+    end. Returns the result rows.
+    """
+    import synthetic_chat
+
+    here = Path(__file__).resolve().parent
+    stages = stages or list(STAGES)
+    rows = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        print(f"{'stage':<18} {'messages':>10} {'seconds':>9} {'msg/s':>12} {'peak RSS':>10} {'blocks':>10} {'gc runs':>8}"
+              + (f" {'traced':>10} {'traced blocks':>14}" if trace else ""))
+        for size in sizes:
+            messages = _size(size)
+            work = Path(tmp) / str(messages)
+            work.mkdir()
+            synthetic_chat.generate_txt(work / "chat.txt", messages, seed)
+            synthetic_chat.generate_msgstore_json(work / "msgstore.json", messages, seed)
+            for name in stages:
+                probe = subprocess.run([sys.executable, "-c", _STAGE_PROBE, str(here), name, str(work), "1" if trace else "0"],
+                                       capture_output=True, text=True)
+                if probe.returncode != 0:
+                    error = (probe.stderr.strip().splitlines() or ["failed"])[-1]
+                    print(f"{name:<18} {messages:>10,} FAILED: {error}")
+                    rows.append({"stage": name, "messages": messages, "error": error})
+                    continue
+                row = {"stage": name, "messages": messages, **json.loads(probe.stdout.strip().splitlines()[-1])}
+                rows.append(row)
+                print(f"{name:<18} {messages:>10,} {row['seconds']:>9.2f} {messages / row['seconds']:>12,.0f} "
+                      f"{row['peak_rss_mb']:>8.0f}MB {row['allocated_blocks']:>+10,} {row['gc_collections']:>8}"
+                      + (f" {row['traced_peak_mb']:>8.1f}MB {row['traced_blocks']:>14,}" if trace else ""))
+            import shutil
+            shutil.rmtree(work)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run chat analyzer micro-benchmarks.")
+    parser.add_argument("benchmark", choices=["parse_line", "timestamps", "startup", "server", "suite"], help="Benchmark to run")
+    parser.add_argument("-f", "--file", help="Optional chat export to use instead of synthetic lines")
+    parser.add_argument("-n", "--lines", type=int, default=200_000, help="Number of synthetic lines or messages (default: 200000)")
+    parser.add_argument("--sizes", nargs="+", default=SUITE_SIZES[:1], help="suite: message counts, e.g. 10k 1M 10M (default: 10k)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), help="suite: stages to run (default: all)")
+    parser.add_argument("--trace", action="store_true", help="suite: also record tracemalloc's peak (slower)")
+    parser.add_argument("--workdir", help="suite: folder for the generated inputs (default: system temp)")
+    parser.add_argument("--json", help="suite: also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.benchmark == "timestamps":
+        bench_timestamps(args.lines)
+        return
+    if args.benchmark == "startup":
+        sys.exit(0 if bench_startup() else 1)
+    if args.benchmark == "server":
+        bench_server(args.lines)
+        return
+    if args.benchmark == "suite":
+        rows = bench_suite(args.sizes, args.stages, args.trace, args.workdir)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, indent=2)
+        return
+
+    if args.file:
+        with Path(args.file).open("r", encoding="utf-8") as f:
+            lines = f.readlines()
+    else:
+        lines = sample_lines(args.lines)
+
+    if args.benchmark == "parse_line":
+        bench_parse_line(lines)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+chat_server.py
+
+Local HTTP service that answers the analyzer's aggregates as JSON, for
+dashboards that would otherwise start a new process per chart.
+
+Parsed chats stay in memory as MessageTables (see message_table.py) in an
+LRU cache with a size budget; a chat is parsed again when its file's size
+or mtime changes (an export that only grew is parsed incrementally, see
+parse_cache.py). Parsing runs in a process pool and query computation in
+threads, so a slow load never blocks queries on chats that are already
+cached. Answers are cached per chat and date range, so a repeated query is
+a dict lookup.
+
+Only files inside --chat-dir are served. Dates are dd/mm/yyyy or yyyy-mm-dd.
+
+Usage:
+    python chat_server.py --chat-dir exports/
+    curl "http://127.0.0.1:8765/daily?chat=WhatsApp%20Chat.txt&start=01/01/2023&end=31/12/2023"
+
+Endpoints (GET):
+    /daily, /authors, /author-daily, /hour-weekday, /author-hour
+                    ?chat=<file in chat-dir>[&start=<date>][&end=<date>]
+    /chats          exports in chat-dir and which of them are cached
+    /stats          cache size, hits, misses, reloads and evictions
+    /health
+"""
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+
+import instrumentation
+
+# --- Configuration ---
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_MB = 512               # Memory budget for parsed chats and cached answers
+PARSE_WORKERS = 2            # Chats parsed at the same time
+ANSWERS_PER_CHAT = 256       # Cached answers (endpoint + date range) per chat
+KEEP_ALIVE_SECONDS = 30      # Idle time before a keep-alive connection is closed
+MAX_REQUEST_BYTES = 16 * 1024
+EXPORT_PATTERN = "*.txt"     # Files listed by /chats
+# ---------------------
+
+QUERIES = { # endpoint: MessageTable method returning the same dicts as data_extraction
+    "daily": "daily_dict",
+    "authors": "author_dict",
+    "author-daily": "author_day_dict",
+    "hour-weekday": "hour_weekday_dict",
+    "author-hour": "author_hour_dict",
+}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+class ChatError(Exception):
+    """A request that can't be answered; carries the HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def load_table(filepath):
+    """
+    Parses one chat (or reads its parse cache) in a worker process.
+    Returns (MessageTable or None, last printed line).
+    """
+    import contextlib
+    import io
+    from parse_cache import load_cached_table
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        table = load_cached_table(filepath)
+    lines = log.getvalue().strip().splitlines()
+    return table, lines[-1] if lines else ""
+
+def file_version(path):
+    """(size, mtime) of a file; a cached chat is reloaded when it changes."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def to_json(result):
+    """Aggregate dicts with dates as ISO-format keys (JSON keys must be strings)."""
+    return {key.isoformat() if isinstance(key, datetime.date) else key: value for key, value in result.items()}
+
+# --- Cache ---
+class CachedChat:
+    """One parsed chat, the file version it was parsed from, and its cached answers."""
+
+    def __init__(self, table, version):
+        self.table = table
+        self.version = version
+        self.answers = OrderedDict() # (endpoint, start, end) -> encoded JSON body
+        self.answer_bytes = 0
+
+    @property
+    def nbytes(self):
+        authors = sum(len(author) for author in self.table.authors)
+        return self.table.nbytes + authors + self.answer_bytes
+
+class ChatCache:
+    """
+    LRU cache of parsed chats, keyed by path, under max_bytes. Loads run in
+    `pool`; concurrent requests for a chat that is loading wait for the
+    same load. A chat that alone exceeds the budget is served but not kept.
+    """
+
+    def __init__(self, max_bytes, pool):
+        self.max_bytes = max_bytes
+        self.pool = pool
+        self.chats = OrderedDict() # path -> CachedChat, least recently used first
+        self.loading = {}          # path -> asyncio.Task
+        self.nbytes = 0
+        self.hits = self.misses = self.reloads = self.evictions = 0
+
+    async def get(self, path):
+        try:
+            version = file_version(path)
+        except OSError:
+            self._drop(path)
+            raise ChatError(404, f"Chat '{path.name}' not found")
+        chat = self.chats.get(path)
+        if chat is not None and chat.version == version:
+            self.chats.move_to_end(path)
+            self.hits += 1
+            return chat
+        task = self.loading.get(path)
+        if task is None:
+            if chat is not None:
+                self.reloads += 1
+            self.misses += 1
+            task = self.loading[path] = asyncio.ensure_future(self._load(path, version))
+            task.add_done_callback(lambda _: self.loading.pop(path, None))
+        return await asyncio.shield(task) # A client hanging up doesn't cancel the load
+
+    async def _load(self, path, version):
+        loop = asyncio.get_running_loop()
+        with instrumentation.stage("chat_server.load"):
+            table, last_line = await loop.run_in_executor(self.pool, load_table, str(path))
+        if table is None:
+            raise ChatError(422, last_line or f"Could not read '{path.name}'")
+        chat = CachedChat(table, version)
+        self._drop(path)
+        if chat.nbytes > self.max_bytes:
+            print(f"Warning: '{path.name}' ({chat.nbytes / 2**20:.0f} MB) exceeds the cache budget; not cached.")
+            return chat
+        self.chats[path] = chat
+        self.nbytes += chat.nbytes
+        self._evict()
+        return chat
+
+    def remember(self, path, chat, key, body):
+        """Caches an answer, dropping the chat's oldest answers past ANSWERS_PER_CHAT."""
+        if self.chats.get(path) is not chat:
+            return # Reloaded or evicted meanwhile
+        chat.answers[key] = body
+        chat.answer_bytes += len(body)
+        self.nbytes += len(body)
+        while len(chat.answers) > ANSWERS_PER_CHAT:
+            _, old = chat.answers.popitem(last=False)
+            chat.answer_bytes -= len(old)
+            self.nbytes -= len(old)
+        self._evict()
+
+    def _drop(self, path):
+        chat = self.chats.pop(path, None)
+        if chat is not None:
+            self.nbytes -= chat.nbytes
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self.chats) > 1:
+            _, chat = self.chats.popitem(last=False)
+            self.nbytes -= chat.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+            "loading": [str(path) for path in self.loading],
+            "chats": [{"chat": str(path), "messages": len(chat.table), "bytes": chat.nbytes, "answers": len(chat.answers)}
+                      for path, chat in self.chats.items()],
+        }
+
+# --- Requests ---
+def parse_date(value, name):
+    for date_format in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ChatError(400, f"Invalid {name} date '{value}', use dd/mm/yyyy or yyyy-mm-dd")
+
+class ChatServer:
+    def __init__(self, chat_dir, cache):
+        self.chat_dir = Path(chat_dir).resolve()
+        self.cache = cache
+
+    def resolve(self, name):
+        """The export a ?chat= name refers to; only files inside chat_dir."""
+        path = (self.chat_dir / name).resolve()
+        if self.chat_dir not in path.parents or not path.is_file():
+            raise ChatError(404, f"Chat '{name}' not found")
+        return path
+
+    async def answer(self, method, target):
+        """Returns (status, JSON-encoded body) for one request."""
+        if method not in ("GET", "HEAD"):
+            raise ChatError(405, f"Method {method} not allowed")
+        url = urlsplit(target)
+        endpoint = url.path.strip("/")
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if endpoint in QUERIES:
+            return 200, await self.query(endpoint, params)
+        if endpoint in ("", "health"):
+            return 200, _encode({"status": "ok"})
+        if endpoint == "stats":
+            return 200, _encode(self.cache.stats())
+        if endpoint == "chats":
+            exports = sorted(self.chat_dir.rglob(EXPORT_PATTERN))
+            return 200, _encode([{"chat": str(path.relative_to(self.chat_dir)), "cached": path.resolve() in self.cache.chats}
+                                 for path in exports])
+        raise ChatError(404, f"Unknown endpoint '/{endpoint}'")
+
+    async def query(self, endpoint, params):
+        if "chat" not in params:
+            raise ChatError(400, "Missing ?chat=")
+        start = parse_date(params["start"], "start") if params.get("start") else None
+        end = parse_date(params["end"], "end") if params.get("end") else None
+        if start and end and start > end:
+            raise ChatError(400, "Start date is after end date")
+
+        path = self.resolve(params["chat"])
+        chat = await self.cache.get(path)
+        key = (endpoint, start, end)
+        body = chat.answers.get(key)
+        if body is not None:
+            return body
+
+        def compute():
+            result = getattr(chat.table.select(start, end), QUERIES[endpoint])()
+            return _encode({
+                "chat": params["chat"],
+                "start": start.isoformat() if start else None,
+                "end": end.isoformat() if end else None,
+                "result": to_json(result),
+            })
+
+        # NumPy releases the GIL for the heavy part, so other requests keep being served
+        body = await asyncio.get_running_loop().run_in_executor(None, compute)
+        self.cache.remember(path, chat, key, body)
+        return body
+
+    async def handle(self, reader, writer):
+        """Serves one connection: HTTP/1.1 with keep-alive, GET only, no request bodies."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_SECONDS)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.split(" ")
+                keep_alive = len(parts) == 3 and parts[2] == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    if len(parts) != 3:
+                        raise ChatError(400, "Malformed request line")
+                    if headers.get("content-length", "0") != "0" or "transfer-encoding" in headers:
+                        keep_alive = False # Request bodies aren't read, so the connection can't be reused
+                    status, body = await self.answer(parts[0], parts[1])
+                except ChatError as e:
+                    status, body = e.status, _encode({"error": str(e)})
+                except Exception as e:
+                    status, body = 500, _encode({"error": f"{type(e).__name__}: {e}"})
+                writer.write(_response(status, body, keep_alive, include_body=parts[0] != "HEAD"))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+def _encode(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _response(status, body, keep_alive, include_body=True):
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body if include_body else head.encode("latin-1")
+
+async def serve(chat_dir=".", host=HOST, port=PORT, cache_mb=CACHE_MB, workers=PARSE_WORKERS, ready=None):
+    """Runs the server until cancelled. ready: optional callback(port) once it is listening."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    # Spawned, not forked: a worker forked while a request is open would inherit its
+    # socket and keep the connection from closing
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        app = ChatServer(chat_dir, ChatCache(int(cache_mb * 2**20), pool))
+        server = await asyncio.start_server(app.handle, host, port, limit=MAX_REQUEST_BYTES)
+        async with server:
+            bound_port = server.sockets[0].getsockname()[1]
+            print(f"Serving '{app.chat_dir}' on http://{host}:{bound_port}/ (Ctrl+C to stop)")
+            if ready is not None:
+                ready(bound_port)
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve chat aggregates as JSON over HTTP.")
+    parser.add_argument("--chat-dir", default=".", help="Folder with the exports to serve (default: current folder)")
+    parser.add_argument("--host", default=HOST, help=f"Address to listen on (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port (default: {PORT}, 0: any free port)")
+    parser.add_argument("--cache-mb", type=float, default=CACHE_MB, help=f"Memory budget for cached chats (default: {CACHE_MB})")
+    parser.add_argument("-w", "--workers", type=int, default=PARSE_WORKERS,
+                        help=f"Chats parsed in parallel (default: {PARSE_WORKERS})")
+    args = parser.parse_args(argv)
+
+    if not Path(args.chat_dir).is_dir():
+        print(f"Error: '{args.chat_dir}' is not a folder.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        asyncio.run(serve(args.chat_dir, args.host, args.port, args.cache_mb, max(1, args.workers)))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+cli.py
+
+One command line for the chat analyzer. Modules are imported by the
+command that needs them, so --help and the data-only commands don't pay
+for plotly or numpy.
+
+Usage:
+    python cli.py daily "WhatsApp Chat.txt" --start 01/01/2023 --end 31/03/2023
+    python cli.py authors "WhatsApp Chat.txt" --csv authors.csv
+    python cli.py daily "WhatsApp Chat.txt" --cache
+    python cli.py author-daily "WhatsApp Chat.txt" --plot
+    python cli.py hour-weekday "WhatsApp Chat.txt" --output plots/activity.html
+    python cli.py daily "WhatsApp Chat.txt" --output plots/daily.html
+    python cli.py clean-txt "WhatsApp Chat.txt" -o cleaned.txt
+    python cli.py clean-json -i msgstore.json --stream
+    python cli.py split -i formatted_chat.json --year
+    python cli.py --report run.json --profile daily "WhatsApp Chat.txt"
+"""
+import argparse
+import sys
+
+# --- Configuration ---
+# Imports (plotly, numpy, process pools) happen inside the commands; keep
+# this module's top level to argparse and sys.
+ANALYSES = {
+    # command: (aggregate name, help)
+    "daily": ("daily", "Messages per day"),
+    "authors": ("authors", "Messages per person"),
+    "author-daily": ("author_daily", "Messages per person per day"),
+    "hour-weekday": ("hour_weekday", "Messages per weekday and hour of day"),
+    "author-hour": ("author_hour", "Messages per person and hour of day"),
+}
+BUCKETED = {"daily", "author-daily"}                     # Date charts that take --bucket
+PER_AUTHOR = {"authors", "author-daily", "author-hour"}  # Charts that take --top
+TOOLS = {
+    # command: (module with main(argv), help)
+    "clean-txt": ("txt_cleaner", "Remove media-omitted (or other matching) lines from .txt exports"),
+    "clean-json": ("json_cleaner", "Format a decrypted msgstore JSON dump"),
+    "split": ("split_by_date", "Split a formatted chat into one JSON file per day"),
+    "conversations": ("conversations", "Reply times per author pair and conversation sessions"),
+    "words": ("text_stats", "Top words, emojis and links, overall, per author or per month"),
+    "serve": ("chat_server", "Serve the aggregates as JSON over local HTTP, with parsed chats cached in memory"),
+}
+REPORT_FILE = "run_report.json" # Where --profile / --trace-memory write without --report
+# ---------------------
+
+def _date(value):
+    from helpers import date_arg
+    return date_arg(value)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="WhatsApp chat analyzer.")
+    parser.add_argument("--report", help="Record stage timings, counts and memory to this JSON file")
+    parser.add_argument("--profile", action="store_true", help="Add a cProfile summary to the report")
+    parser.add_argument("--trace-memory", action="store_true", help="Add tracemalloc's peak and top allocations to the report")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    for command, (_, help_text) in ANALYSES.items():
+        sub = commands.add_parser(command, help=help_text, description=help_text + ".")
+        sub.add_argument("file", help="Chat export (.txt)")
+        sub.add_argument("--start", type=_date, help="Start date, dd/mm/yyyy")
+        sub.add_argument("--end", type=_date, help="End date, dd/mm/yyyy")
+        sub.add_argument("-w", "--workers", type=int, default=1, help="Worker processes (0: one per CPU, default: 1)")
+        sub.add_argument("--cache", action="store_true",
+                         help="Keep a parse cache next to the export, so later runs only parse appended lines "
+                              "(loads numpy; used anyway once the export has one)")
+        sub.add_argument("--csv", help="Write the result to this CSV file instead of printing it")
+        sub.add_argument("--plot", action="store_true", help="Open the chart in the browser")
+        sub.add_argument("--output", help="Write the chart to a .html, .png or .svg file")
+        if command in BUCKETED:
+            sub.add_argument("--bucket", choices=["auto", "day", "week", "month"], default="auto",
+                             help="Time bucket for the chart (default: auto, from the range length)")
+        if command in PER_AUTHOR:
+            sub.add_argument("--top", type=int, help="Authors shown individually in the chart; the rest are grouped as 'Others'")
+
+    # These forward their own arguments (including -h) to the tool's main()
+    for command, (_, help_text) in TOOLS.items():
+        commands.add_parser(command, help=help_text, add_help=False)
+    return parser
+
+def run_analysis(command, args):
+    from data_extraction import result_rows, scan_chat
+    from helpers import CACHE_SUFFIX, sidecar_path
+
+    name = ANALYSES[command][0]
+    # Reading the parse cache needs numpy, so small one-off runs scan the file instead
+    use_cache = args.cache or sidecar_path(args.file, CACHE_SUFFIX).exists()
+    # Progress goes to stderr so printed CSV stays clean
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        results = scan_chat(args.file, [name], args.start, args.end, args.workers or None, use_cache)
+    finally:
+        sys.stdout = stdout
+    if results is None:
+        return 1
+    result = results[name]
+
+    if args.plot or args.output:
+        plot_result(command, result, args)
+    if args.csv or not (args.plot or args.output):
+        import csv
+        header, rows = result_rows(name, result)
+        with (open(args.csv, 'w', encoding='utf-8', newline='') if args.csv else _stdout()) as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+    return 0
+
+def _stdout():
+    import contextlib
+    return contextlib.nullcontext(sys.stdout)
+
+def plot_result(command, result, args):
+    import plot
+
+    if not result:
+        print("No data found to plot.")
+        return
+    if command == "daily":
+        plot.plot_daily_graph(result, args.start, args.end, args.bucket, args.output)
+    elif command == "authors":
+        plot.plot_author_graph(result, plot.TOP_AUTHORS if args.top is None else args.top, args.output)
+    elif command == "hour-weekday":
+        plot.plot_hour_weekday_heatmap(result, args.start, args.end, args.output)
+    elif command == "author-hour":
+        plot.plot_author_hour_heatmap(result, plot.TOP_AUTHORS if args.top is None else args.top, args.output)
+    else:
+        top_n = plot.TOP_AUTHORS if args.top is None else args.top
+        plot.plot_daily_author_graph(result, args.start, args.end, args.bucket, top_n, args.output)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+
+    if not (args.report or args.profile or args.trace_memory):
+        return run_command(parser, args, rest)
+    import instrumentation
+    instrumentation.enable(profile=args.profile, trace_memory=args.trace_memory)
+    try:
+        with instrumentation.stage(f"cli.{args.command}"):
+            return run_command(parser, args, rest)
+    finally:
+        report_path = args.report or REPORT_FILE
+        instrumentation.write_report(report_path)
+        print(f"Run report written to '{report_path}'.", file=sys.stderr)
+
+def run_command(parser, args, rest):
+    if args.command in TOOLS:
+        import importlib
+        tool = importlib.import_module(TOOLS[args.command][0])
+        return tool.main(rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    if args.start and args.end and args.start > args.end:
+        parser.error("start date is after end date")
+    return run_analysis(args.command, args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+conversations.py
+
+Reply times and conversation sessions, in one streaming pass over a chat.
+
+Messages are read in order, either from a .txt export (with the same
+scanner as data_extraction.py) or from json_cleaner.py's output (JSON array
+or NDJSON), told apart by the file extension (see --format). A session ends after --gap minutes of silence. Within a
+session, each change of author counts as a reply, and its latency is the
+time since the previous author's last message. Latencies, session
+durations and session sizes go into DDSketches (see sketches.py) instead
+of lists. Memory therefore depends only on the number of authors, not on
+the length of the chat.
+
+.txt exports only have minute resolution, so replies within the same
+minute count as 0s.
+
+Usage:
+    python conversations.py "WhatsApp Chat.txt"
+    python conversations.py formatted_chat.json --gap 30
+    python conversations.py chat_export --format txt
+    python conversations.py "WhatsApp Chat.txt" --start 01/01/2023 --end 31/12/2023 --csv latency.csv
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import csv
+import sys
+
+from helpers import date_arg, filter_by_date
+from sketches import DDSketch
+import instrumentation
+
+# --- Configuration ---
+SESSION_GAP_MINUTES = 60       # Silence that ends a conversation session
+QUANTILES = [0.5, 0.9, 0.99]
+QUANTILE_NAMES = ["median", "p90", "p99"]
+FORMAT_SUFFIXES = {".txt": "txt", ".json": "json", ".ndjson": "json"}
+# ---------------------
+
+class ConversationStats:
+    """
+    Streaming reply-latency and session statistics. Feed messages in
+    chronological order with add(timestamp_seconds, author), then call
+    finish(). State: the previous message, the open session, and one
+    DDSketch per (replied-to, replying) author pair.
+    """
+
+    def __init__(self, session_gap=SESSION_GAP_MINUTES * 60):
+        self.session_gap = session_gap
+        self.latency = {}             # (from_author, to_author) -> DDSketch of seconds
+        self.session_seconds = DDSketch()
+        self.session_messages = DDSketch()
+        self.messages = 0
+        self.out_of_order = 0         # Messages older than the one before (treated as simultaneous)
+        self.longest_session = None   # (seconds, start timestamp, messages)
+        self._last_time = None
+        self._last_author = None
+        self._session_start = None
+        self._session_size = 0
+
+    def add(self, timestamp, author):
+        self.messages += 1
+        last_time = self._last_time
+        if last_time is None:
+            self._start_session(timestamp)
+        else:
+            gap = timestamp - last_time
+            if gap < 0:
+                self.out_of_order += 1
+                gap, timestamp = 0, last_time
+            if gap > self.session_gap:
+                self._end_session()
+                self._start_session(timestamp)
+            elif author != self._last_author:
+                pair = (self._last_author, author)
+                sketch = self.latency.get(pair)
+                if sketch is None:
+                    sketch = self.latency[pair] = DDSketch()
+                sketch.add(gap)
+        self._session_size += 1
+        self._last_time = timestamp
+        self._last_author = author
+
+    def _start_session(self, timestamp):
+        self._session_start = timestamp
+        self._session_size = 0
+
+    def _end_session(self):
+        duration = self._last_time - self._session_start
+        self.session_seconds.add(duration)
+        self.session_messages.add(self._session_size)
+        if self.longest_session is None or duration > self.longest_session[0]:
+            self.longest_session = (duration, self._session_start, self._session_size)
+
+    def finish(self):
+        """Closes the open session. Call once, after the last message."""
+        if self._last_time is not None and self._session_size:
+            self._end_session()
+            self._session_size = 0
+        return self
+
+    # --- Results ---
+    def latency_rows(self):
+        """One row per author pair: [from, to, replies, mean, median, p90, p99] in seconds, busiest pairs first."""
+        rows = []
+        for (from_author, to_author), sketch in self.latency.items():
+            rows.append([from_author, to_author, sketch.count, sketch.mean] + sketch.quantiles(QUANTILES))
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows
+
+    def reply_totals(self):
+        """Replies by each author, over every pair: {author: DDSketch}."""
+        totals = {}
+        for (_, to_author), sketch in self.latency.items():
+            if to_author not in totals:
+                totals[to_author] = DDSketch()
+            totals[to_author].merge(sketch)
+        return totals
+
+    def session_summary(self):
+        return {
+            "messages": self.messages,
+            "sessions": self.session_seconds.count,
+            "duration": self.session_seconds.quantiles(QUANTILES),
+            "size": self.session_messages.quantiles(QUANTILES),
+            "longest": self.longest_session,
+        }
+
+# --- Sources ---
+# Both yield (timestamp_seconds, author) in file order. Timestamps only
+# need to be comparable within one chat.
+def iter_txt_messages(filepath, start_date=None, end_date=None, date_format="%d/%m/%Y"):
+    """User messages of a .txt export, timed from their date and hh:mm (local time, minute resolution)."""
+    from scanner import LineScanner, open_mmap
+    with open_mmap(filepath) as buf:
+        for date_obj, minute, author, _, _ in LineScanner(date_format).scan(buf, with_time=True):
+            if author and minute is not None and filter_by_date(date_obj, start_date, end_date):
+                yield date_obj.toordinal() * 86400 + minute * 60, author
+
+def iter_json_messages(filepath, start_date=None, end_date=None):
+    """Messages of json_cleaner's output (JSON array or NDJSON), timed from their ISO timestamps."""
+    from split_by_date import iter_messages
+    for msg in iter_messages(filepath):
+        try:
+            moment = datetime.fromisoformat(msg["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        author = msg.get("author")
+        if author and filter_by_date(moment.date(), start_date, end_date):
+            yield moment.timestamp(), author
+
+def detect_format(filepath):
+    """
+    "txt" or "json", from the extension (FORMAT_SUFFIXES). Other files are
+    json_cleaner output only if their first message parses as a JSON object:
+    a .txt export can start with '[' too (iOS exports do).
+    """
+    file_format = FORMAT_SUFFIXES.get(Path(filepath).suffix.lower())
+    if file_format is not None:
+        return file_format
+    from split_by_date import iter_messages
+    messages = iter_messages(filepath)
+    try:
+        first = next(messages, None)
+    except ValueError: # Includes JSONDecodeError and UnicodeDecodeError
+        return "txt"
+    finally:
+        messages.close()
+    return "json" if isinstance(first, dict) else "txt"
+
+def analyze_chat(filepath, start_date=None, end_date=None, session_gap=SESSION_GAP_MINUTES * 60, file_format=None):
+    """
+    Runs ConversationStats over a .txt export or a json_cleaner output file
+    (file_format "txt" / "json", or None to detect it).
+    Returns the finished ConversationStats, or None if the file could not be read.
+    """
+    print(f"\nProcessing file for reply times and sessions...")
+    try:
+        if file_format is None:
+            file_format = detect_format(filepath)
+        messages = iter_json_messages(filepath, start_date, end_date) if file_format == "json" \
+            else iter_txt_messages(filepath, start_date, end_date)
+        stats = ConversationStats(session_gap)
+        with instrumentation.stage("conversations.scan") as stage:
+            add = stats.add
+            for timestamp, author in messages:
+                add(timestamp, author)
+            stats.finish()
+            stage.add(messages=stats.messages, out_of_order=stats.out_of_order)
+    except FileNotFoundError:
+        print(f"Error: The file '{filepath}' was not found.")
+        return None
+    except Exception as e:
+        print(f"An error occurred while reading the file: {e}")
+        return None
+    print(f"File processed. Found {stats.messages} messages in {stats.session_seconds.count} sessions.")
+    return stats
+
+# --- Output ---
+def format_duration(seconds):
+    """42 -> '42s', 3900 -> '1h 05m', None -> '-'."""
+    if seconds is None:
+        return "-"
+    seconds = round(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h {minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours:02d}h"
+
+def print_report(stats, top=None):
+    rows = stats.latency_rows()
+    print(f"\nReply times ({len(rows)} author pairs, {sum(row[2] for row in rows)} replies):")
+    print(f"  {'from':<24} {'to':<24} {'replies':>8} " + " ".join(f"{name:>9}" for name in QUANTILE_NAMES))
+    for from_author, to_author, replies, _, *quantiles in rows[:top]:
+        print(f"  {from_author[:24]:<24} {to_author[:24]:<24} {replies:>8} " +
+              " ".join(f"{format_duration(value):>9}" for value in quantiles))
+
+    print("\nReply times by replying author:")
+    totals = sorted(stats.reply_totals().items(), key=lambda item: item[1].count, reverse=True)
+    for author, sketch in totals[:top]:
+        quantiles = " ".join(f"{name} {format_duration(value)}" for name, value in zip(QUANTILE_NAMES, sketch.quantiles(QUANTILES)))
+        print(f"  {author[:24]:<24} {sketch.count:>8} replies, {quantiles}")
+
+    summary = stats.session_summary()
+    gap = format_duration(stats.session_gap)
+    print(f"\nSessions (split after {gap} of silence): {summary['sessions']}")
+    if summary["sessions"]:
+        print("  duration: " + ", ".join(f"{name} {format_duration(value)}" for name, value in zip(QUANTILE_NAMES, summary["duration"])))
+        print("  messages: " + ", ".join(f"{name} {round(value)}" for name, value in zip(QUANTILE_NAMES, summary["size"])))
+        duration, _, size = summary["longest"]
+        print(f"  longest:  {format_duration(duration)} ({size} messages)")
+    if stats.out_of_order:
+        print(f"\nWarning: {stats.out_of_order} messages were older than the message before them.")
+
+def write_latency_csv(stats, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["from", "to", "replies", "mean_seconds"] + [f"{name}_seconds" for name in QUANTILE_NAMES])
+        writer.writerows(stats.latency_rows())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reply times and conversation sessions of a chat.")
+    parser.add_argument("file", help="Chat export (.txt) or json_cleaner output (.json / .ndjson)")
+    parser.add_argument("--format", choices=["txt", "json"],
+                        help="Input format (default: from the extension, .txt / .json / .ndjson)")
+    parser.add_argument("--gap", type=float, default=SESSION_GAP_MINUTES,
+                        help=f"Minutes of silence that end a session (default: {SESSION_GAP_MINUTES})")
+    parser.add_argument("--start", type=date_arg, help="Start date, dd/mm/yyyy")
+    parser.add_argument("--end", type=date_arg, help="End date, dd/mm/yyyy")
+    parser.add_argument("--top", type=int, help="Rows shown per table (default: all)")
+    parser.add_argument("--csv", help="Also write the per-pair reply times to this CSV file")
+    args = parser.parse_args(argv)
+
+    if args.start and args.end and args.start > args.end:
+        print("Error: Start date is after end date.", file=sys.stderr)
+        sys.exit(1)
+    if args.gap <= 0:
+        print("Error: --gap must be positive.", file=sys.stderr)
+        sys.exit(1)
+
+    stats = analyze_chat(args.file, args.start, args.end, args.gap * 60, args.format)
+    if stats is None:
+        sys.exit(1)
+    print_report(stats, args.top)
+    if args.csv:
+        write_latency_csv(stats, args.csv)
+        print(f"\nReply times written to '{args.csv}'.")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,462 @@
+from array import array
 from collections import defaultdict
-from helpers import *
+import os
+from helpers import CHUNKS_PER_WORKER, CUBE_SUFFIX, file_fingerprint, filter_by_date, sidecar_path, split_ranges
+from date_index import DateIndex, load_date_index, merge_day_starts, save_date_index
+from scanner import MAX_DATE_BYTES, LineScanner, open_mmap
+import instrumentation
 
-# --- (Function 1) Extract Daily Counts ---
-def extract_messages_per_day(filepath, start_date=None, end_date=None):
-    message_counts = defaultdict(int)
-    date_format = "%d/%m/%Y"
-    print("\nProcessing file for daily counts...")
+# --- Aggregate Registry ---
+# Every aggregate is a small class with add(date_obj, author), merge(other),
+# result() and summary(). scan_chat() feeds all requested aggregates from a
+# single read of the export, so new analyses only need to register a class
+# here. merge() combines partial aggregates from parallel workers, so
+# aggregates must stay picklable (no lambdas).
+#
+# Columnar aggregates (columnar = True) have add_table(table) instead of
+# add(): the scan collects day / minute / author columns and hands them over
+# as a message_table.MessageTable every TABLE_BATCH_ROWS messages, so they
+# are computed with one bincount per batch rather than per-line dict updates.
+#
+# Text aggregates (text = True) have add_text(date_obj, author, body) instead
+# of add(): body is the raw bytes of the message text, and every
+# continuation line of a multi-line message is passed on its own with the
+# date and author of the message it belongs to.
+AGGREGATES = {}
+TABLE_BATCH_ROWS = 1_000_000 # Messages collected before columnar aggregates run over them
+TEXT_BATCH_BYTES = 4 * 1024 * 1024 # Message text buffered before it is tokenized
+TOKENS_KEPT = 100            # Tokens per kind and author / month in a "tokens" result
+# Aggregates the parse cache's MessageTable answers directly: name -> its dict view
+TABLE_VIEWS = {"daily": "daily_dict", "authors": "author_dict", "author_daily": "author_day_dict",
+               "hour_weekday": "hour_weekday_dict", "author_hour": "author_hour_dict"}
 
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                date_obj, author = parse_line(line, date_format)
+def register_aggregate(name):
+    """Class decorator that makes an aggregate available to scan_chat() by name."""
+    def decorator(cls):
+        AGGREGATES[name] = cls
+        return cls
+    return decorator
+
+@register_aggregate("daily")
+class DailyCounts:
+    """Counts messages per day. Result: {date: count, ...}"""
+    label = "daily counts"
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def add(self, date_obj, author):
+        self.counts[date_obj] += 1
+
+    def merge(self, other):
+        for date_obj, count in other.counts.items():
+            self.counts[date_obj] += count
+
+    def result(self):
+        return self.counts
+
+    def summary(self):
+        return f"Found messages across {len(self.counts)} days."
+
+@register_aggregate("authors")
+class AuthorCounts:
+    """Counts messages per author. Result: {author: count, ...}"""
+    label = "author counts"
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def add(self, date_obj, author):
+        self.counts[author] += 1
+
+    def merge(self, other):
+        for author, count in other.counts.items():
+            self.counts[author] += count
+
+    def result(self):
+        return self.counts
+
+    def summary(self):
+        return f"Found messages from {len(self.counts)} authors."
+
+def _author_counter():
+    return defaultdict(int)
+
+@register_aggregate("author_daily")
+class DailyAuthorCounts:
+    """Counts messages per author, per day. Result: {date: {author: count, ...}, ...}"""
+    label = "daily author counts"
+
+    def __init__(self):
+        self.counts = defaultdict(_author_counter)
+
+    def add(self, date_obj, author):
+        self.counts[date_obj][author] += 1
+
+    def merge(self, other):
+        for date_obj, author_counts in other.counts.items():
+            for author, count in author_counts.items():
+                self.counts[date_obj][author] += count
+
+    def result(self):
+        return self.counts
+
+    def summary(self):
+        return f"Found data across {len(self.counts)} days."
+
+@register_aggregate("hour_weekday")
+class HourWeekdayCounts:
+    """Counts messages per weekday and hour of day. Result: {weekday: [24 hourly counts], ...}, Monday first"""
+    label = "hour x weekday counts"
+    columnar = True
+
+    def __init__(self):
+        self.matrix = None
+
+    def add_table(self, table):
+        _, matrix = table.hour_weekday_matrix()
+        self.matrix = matrix if self.matrix is None else self.matrix + matrix
+
+    def merge(self, other):
+        if other.matrix is not None:
+            self.matrix = other.matrix if self.matrix is None else self.matrix + other.matrix
+
+    def result(self):
+        from message_table import WEEKDAYS
+        rows = self.matrix.tolist() if self.matrix is not None else [[0] * 24 for _ in WEEKDAYS]
+        return dict(zip(WEEKDAYS, rows))
+
+    def summary(self):
+        total = int(self.matrix.sum()) if self.matrix is not None else 0
+        return f"Found {total} timed messages by hour and weekday."
+
+@register_aggregate("author_hour")
+class AuthorHourCounts:
+    """Counts messages per author and hour of day. Result: {author: [24 hourly counts], ...}"""
+    label = "author x hour counts"
+    columnar = True
+
+    def __init__(self):
+        self.counts = {}
+
+    def add_table(self, table):
+        authors, matrix = table.author_hour_matrix()
+        for author, row in zip(authors, matrix):
+            self.counts[author] = self.counts[author] + row if author in self.counts else row
+
+    def merge(self, other):
+        for author, row in other.counts.items():
+            self.counts[author] = self.counts[author] + row if author in self.counts else row
+
+    def result(self):
+        return {author: row.tolist() for author, row in self.counts.items()}
+
+    def summary(self):
+        return f"Found hourly activity for {len(self.counts)} authors."
+
+@register_aggregate("tokens")
+class TopTokens:
+    """
+    Top words, emojis and links (see text_stats.py), overall, per author and
+    per month, each counted in a bounded sketches.SpaceSaving.
+    Result: {"all": {kind: [(token, count, error), ...]},
+             "authors": {author: {kind: [...]}}, "months": {"yyyy-mm": {kind: [...]}}}
+    """
+    label = "top words, emojis and links"
+    text = True
+
+    def __init__(self):
+        self.all = {}
+        self.authors = {}
+        self.months = {}
+        self._month_of = {}
+        self._buffer = defaultdict(list) # (author, month) -> message bodies not tokenized yet
+        self._buffered = 0
+
+    def add_text(self, date_obj, author, body):
+        month = self._month_of.get(date_obj)
+        if month is None:
+            month = self._month_of[date_obj] = f"{date_obj.year:04d}-{date_obj.month:02d}"
+        self._buffer[author, month].append(body)
+        self._buffered += len(body)
+        if self._buffered >= TEXT_BATCH_BYTES:
+            self.flush()
+
+    def flush(self):
+        """Tokenizes the buffered text, one block per author and month, into the sketches."""
+        from text_stats import PLACEHOLDERS, count_tokens
+        for (author, month), bodies in self._buffer.items():
+            text = b"\n".join(body for body in bodies if body.strip() not in PLACEHOLDERS)
+            counts = count_tokens(text)
+            for group in (self.all, self._group(self.authors, author), self._group(self.months, month)):
+                for kind, kind_counts in counts.items():
+                    if kind_counts:
+                        _sketch(group, kind).update(kind_counts)
+        self._buffer.clear()
+        self._buffered = 0
+
+    @staticmethod
+    def _group(groups, key):
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {}
+        return group
+
+    def merge(self, other):
+        other.flush()
+        for mine, theirs in [(self.all, other.all)] + \
+                [(self._group(self.authors, a), group) for a, group in other.authors.items()] + \
+                [(self._group(self.months, m), group) for m, group in other.months.items()]:
+            for kind, sketch in theirs.items():
+                _sketch(mine, kind).merge(sketch)
+
+    def result(self):
+        from text_stats import KINDS
+        self.flush()
+        def tops(group):
+            return {kind: group[kind].top(TOKENS_KEPT) if kind in group else [] for kind in KINDS}
+        return {"all": tops(self.all),
+                "authors": {author: tops(group) for author, group in self.authors.items()},
+                "months": {month: tops(group) for month, group in sorted(self.months.items())}}
+
+    def summary(self):
+        self.flush()
+        words = self.all.get("words")
+        return f"Counted {words.total if words else 0} words from {len(self.authors)} authors."
+
+def _sketch(group, kind):
+    sketch = group.get(kind)
+    if sketch is None:
+        from sketches import SpaceSaving
+        sketch = group[kind] = SpaceSaving()
+    return sketch
+
+class _TableCollector:
+    """
+    Collects the day / minute / author columns of scanned messages (the
+    MessageTable encoding, without lengths) and feeds them to the columnar
+    aggregates as a MessageTable every TABLE_BATCH_ROWS messages.
+    """
+
+    def __init__(self, aggregates):
+        self.aggregates = aggregates
+        self.authors = []
+        self.author_codes = {}
+        self._reset()
+
+    def _reset(self):
+        self.day = array('i')
+        self.minute = array('h')
+        self.author = array('h')
+
+    def add(self, date_obj, minute, author):
+        # Appends inlined (no MessageTableBuilder.add_message call): this runs once per message
+        code = self.author_codes.get(author)
+        if code is None:
+            code = self.author_codes[author] = len(self.authors)
+            self.authors.append(author)
+        self.day.append(date_obj.toordinal())
+        self.minute.append(-1 if minute is None else minute) # message_table.NO_TIME
+        self.author.append(code)
+        if len(self.day) >= TABLE_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not len(self.day):
+            return
+        import numpy as np # Only loaded when a columnar aggregate runs
+        from message_table import MessageTable
+        table = MessageTable(np.frombuffer(self.day, dtype=np.int32).copy(),
+                             np.frombuffer(self.author, dtype=np.int16).copy(),
+                             np.frombuffer(self.minute, dtype=np.int16).copy(),
+                             np.zeros(len(self.day), dtype=np.uint16), list(self.authors))
+        for agg in self.aggregates:
+            agg.add_table(table)
+        self._reset()
+
+def result_rows(name, result):
+    """Flattens one aggregate result into (header, rows) for CSV-style output."""
+    if name == "daily":
+        return ["date", "count"], [[d.isoformat(), c] for d, c in result.items()]
+    if name == "authors":
+        return ["author", "count"], [[a, c] for a, c in result.items()]
+    if name == "author_daily":
+        return ["date", "author", "count"], [[d.isoformat(), a, c] for d, counts in result.items() for a, c in counts.items()]
+    if name == "hour_weekday":
+        return ["weekday", "hour", "count"], [[w, h, c] for w, counts in result.items() for h, c in enumerate(counts)]
+    if name == "author_hour":
+        return ["author", "hour", "count"], [[a, h, c] for a, counts in result.items() for h, c in enumerate(counts)]
+    if name == "tokens":
+        groups = [("all", "All", result["all"])] + [("author", a, g) for a, g in result["authors"].items()] + \
+                 [("month", m, g) for m, g in result["months"].items()]
+        return ["group", "key", "kind", "rank", "token", "count", "error"], \
+               [[group, key, kind, rank, token, count, error] for group, key, tops in groups
+                for kind, top in tops.items() for rank, (token, count, error) in enumerate(top, 1)]
+    # Aggregates registered elsewhere: one row per key, value as-is
+    return ["key", "value"], [[k, v] for k, v in result.items()]
+
+# --- Scan Engine ---
+def _scan_range(filepath, start, end, aggregate_names, start_date, end_date, track_days=False, count_lines=False):
+    """
+    Runs fresh aggregates over bytes [start, end) of the file (end=None: to
+    the end). The file is memory-mapped and scanned as bytes, so message text
+    is never decoded. Also the worker function for parallel scans.
+    Returns (aggregates, day_starts, line_counts); day_starts is None unless
+    track_days, line_counts is None unless count_lines (see instrumentation.py).
+    """
+    aggregates = {name: AGGREGATES[name]() for name in aggregate_names}
+    adders = [agg.add for agg in aggregates.values()
+              if not getattr(agg, "columnar", False) and not getattr(agg, "text", False)]
+    columnar = [agg for agg in aggregates.values() if getattr(agg, "columnar", False)]
+    texts = [agg for agg in aggregates.values() if getattr(agg, "text", False)]
+    collector = _TableCollector(columnar) if columnar else None
+    collect = collector.add if collector else None
+    day_starts = [] if track_days else None
+    line_counts = None
+    with open_mmap(filepath) as buf:
+        scanner = LineScanner("%d/%m/%Y")
+        lines = scanner.scan(buf, start, end, with_time=collector is not None, day_starts=day_starts)
+        if texts:
+            # A range can start inside a multi-line message; its first lines belong to that message
+            lines = _feed_text(lines, [agg.add_text for agg in texts], start_date, end_date,
+                               _message_before(scanner, buf, start))
+        if count_lines:
+            line_counts = _scan_counted(lines, adders, collect, start_date, end_date)
+        else:
+            for date_obj, minute, author, _, _ in lines:
                 if author and filter_by_date(date_obj, start_date, end_date):
-                    message_counts[date_obj] += 1
-        
-        print(f"File processed. Found messages across {len(message_counts)} days.")
-        return message_counts
+                    for add in adders:
+                        add(date_obj, author)
+                    if collect:
+                        collect(date_obj, minute, author)
+    if collector:
+        collector.flush()
+    for agg in texts:
+        agg.flush()
+    return aggregates, day_starts, line_counts
+
+def _feed_text(lines, text_adders, start_date, end_date, current=None):
+    """
+    Passes scanned lines through unchanged, handing the body of every
+    counted message and of its continuation lines to the text aggregates.
+    current: (date_obj, author) of the message a leading continuation line
+    belongs to, or None.
+    """
+    if current is not None and not filter_by_date(current[0], start_date, end_date):
+        current = None
+    for item in lines:
+        date_obj, _, author, line, body_start = item
+        if date_obj is None:
+            if current is None:
+                yield item
+                continue
+            body = line
+        elif author and filter_by_date(date_obj, start_date, end_date):
+            current = (date_obj, author)
+            body = line[body_start:]
+        else:
+            current = None # System line or out of range: its continuation lines aren't counted either
+            yield item
+            continue
+        for add_text in text_adders:
+            add_text(current[0], current[1], body)
+        yield item
+
+def _message_before(scanner, buf, position):
+    """(date_obj, author) of the message whose line ends just before position, walking back over continuation lines."""
+    while position > 0:
+        line_start = buf.rfind(b"\n", 0, position - 1) + 1
+        for date_obj, _, author, _, _ in scanner.scan(buf, line_start, position, with_time=False):
+            if date_obj is not None:
+                return (date_obj, author) if author else None
+        position = line_start
+    return None
+
+def _scan_counted(lines, adders, collect, start_date, end_date):
+    """The _scan_range loop with a tally of what happened to every line."""
+    counts = dict.fromkeys(["lines", "messages", "rejected_continuation", "rejected_bad_date",
+                            "rejected_system", "rejected_out_of_range"], 0)
+    for date_obj, minute, author, line, _ in lines:
+        counts["lines"] += 1
+        if date_obj is None:
+            # The scanner reports both as undated; a short, digit-led field before the
+            # first comma looks like a date that didn't parse
+            comma = line.find(b",", 0, MAX_DATE_BYTES + 1)
+            counts["rejected_bad_date" if 0 < comma <= 12 and line[:1].isdigit() else "rejected_continuation"] += 1
+        elif not author:
+            counts["rejected_system"] += 1
+        elif not filter_by_date(date_obj, start_date, end_date):
+            counts["rejected_out_of_range"] += 1
+        else:
+            counts["messages"] += 1
+            for add in adders:
+                add(date_obj, author)
+            if collect:
+                collect(date_obj, minute, author)
+    return counts
+
+def scan_chat(filepath, aggregate_names, start_date=None, end_date=None, workers=1, use_cache=True):
+    """
+    Reads the chat file once and feeds every parsed user message to each of
+    the requested aggregates. With workers != 1 the file is split into
+    line-aligned byte ranges that are scanned in a process pool and merged
+    (workers=None uses every CPU).
+
+    If a prefix cube was built for the file (see prefix_cube.py), the
+    built-in aggregates are answered from it without reading the file at
+    all. Otherwise, when every requested aggregate is in TABLE_VIEWS and
+    use_cache is set, they are answered from the parse cache (see
+    parse_cache.py): an export that only grew at the end has just its new
+    lines parsed. Any other scan saves a date index next to the file on its
+    first run (see date_index.py); later date-filtered scans only read the
+    byte range between start_date and end_date.
+    Returns: {name: result, ...} or None if the file could not be read.
+    """
+    aggregates = {name: AGGREGATES[name]() for name in aggregate_names}
+    labels = ", ".join(agg.label for agg in aggregates.values())
+    print(f"\nProcessing file for {labels}...")
+    workers = workers or os.cpu_count() or 1
+
+    count_lines = instrumentation.enabled()
+    try:
+        fingerprint = file_fingerprint(filepath)
+        with instrumentation.stage("scan_chat.cube_lookup"):
+            results = _cube_results(filepath, fingerprint, aggregate_names, start_date, end_date)
+        if results is not None:
+            print("Answered from prefix cube.")
+            return results
+        if use_cache and set(aggregate_names) <= TABLE_VIEWS.keys():
+            return _table_results(filepath, aggregate_names, start_date, end_date, workers)
+        index = load_date_index(filepath, fingerprint)
+        start, end = 0, fingerprint["size"]
+        if index is not None and (start_date or end_date):
+            start, end = index.byte_range(start_date, end_date)
+            print(f"Using date index: reading {end - start} of {fingerprint['size']} bytes.")
+        track_days = index is None
+
+        with instrumentation.stage("scan_chat.scan") as stage:
+            stage.add(bytes=end - start)
+            if workers == 1:
+                aggregates, day_starts, line_counts = _scan_range(filepath, start, end, list(aggregates),
+                                                                  start_date, end_date, track_days, count_lines)
+                day_starts = [day_starts]
+                if line_counts:
+                    stage.add(**line_counts)
+            else:
+                from concurrent.futures import ProcessPoolExecutor # Deferred: ~25ms to import
+                ranges = split_ranges(filepath, workers * CHUNKS_PER_WORKER, start, end)
+                day_starts = []
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(_scan_range, filepath, range_start, range_end, list(aggregates),
+                                           start_date, end_date, track_days, count_lines)
+                               for range_start, range_end in ranges]
+                    for future in futures:
+                        partials, partial_days, line_counts = future.result()
+                        day_starts.append(partial_days)
+                        if line_counts:
+                            stage.add(**line_counts)
+                        for name, partial in partials.items():
+                            aggregates[name].merge(partial)
     except FileNotFoundError:
         print(f"Error: The file '{filepath}' was not found.")
         return None
@@ -23,50 +464,59 @@ def extract_messages_per_day(filepath, start_date=None, end_date=None):
         print(f"An error occurred while reading the file: {e}")
         return None
 
-# --- (Function 2) Extract Author Counts ---
-def extract_messages_per_person(filepath, start_date=None, end_date=None):
-    author_counts = defaultdict(int)
-    date_format = "%d/%m/%Y"
-    print("\nProcessing file for author counts...")
+    if track_days:
+        with instrumentation.stage("scan_chat.date_index"):
+            index = DateIndex.from_day_starts(merge_day_starts(day_starts), fingerprint["size"])
+            if index is not None:
+                try:
+                    save_date_index(filepath, index, fingerprint)
+                except OSError as e:
+                    print(f"Warning: Could not write date index: {e}")
 
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                date_obj, author = parse_line(line, date_format)
-                if author and filter_by_date(date_obj, start_date, end_date):
-                    author_counts[author] += 1
-        
-        print(f"File processed. Found messages from {len(author_counts)} authors.")
-        return author_counts
-    except FileNotFoundError:
-        print(f"Error: The file '{filepath}' was not found.")
+    print("File processed. " + " ".join(agg.summary() for agg in aggregates.values()))
+    return {name: agg.result() for name, agg in aggregates.items()}
+
+def _cube_results(filepath, fingerprint, aggregate_names, start_date, end_date):
+    """Returns the aggregates from a valid prefix cube, or None if there is none or it can't answer them."""
+    if not sidecar_path(filepath, CUBE_SUFFIX).exists():
         return None
-    except Exception as e:
-        print(f"An error occurred while reading the file: {e}")
+    from prefix_cube import SUPPORTED_AGGREGATES, load_prefix_cube # numpy is only loaded when there is a cube
+    if not set(aggregate_names) <= SUPPORTED_AGGREGATES:
         return None
+    cube = load_prefix_cube(filepath, fingerprint)
+    if cube is None:
+        return None
+    return cube.results(aggregate_names, start_date, end_date)
+
+def _table_results(filepath, aggregate_names, start_date, end_date, workers):
+    """Answers TABLE_VIEWS aggregates from the parse cache's MessageTable, or returns None if the file could not be read."""
+    from parse_cache import load_cached_table # numpy is only loaded on this path
+    with instrumentation.stage("scan_chat.table"):
+        table = load_cached_table(filepath, workers=workers)
+        if table is None:
+            return None
+        table = table.select(start_date, end_date)
+        return {name: getattr(table, TABLE_VIEWS[name])() for name in aggregate_names}
+
+def _scan_single(filepath, aggregate_name, start_date, end_date, workers=1, use_cache=True):
+    results = scan_chat(filepath, [aggregate_name], start_date, end_date, workers, use_cache)
+    return results[aggregate_name] if results is not None else None
+
+# The extractors read the parse cache, so re-running one on an export that
+# only grew parses just the appended lines (see scan_chat).
+
+# --- (Function 1) Extract Daily Counts ---
+def extract_messages_per_day(filepath, start_date=None, end_date=None, workers=1, use_cache=True):
+    return _scan_single(filepath, "daily", start_date, end_date, workers, use_cache)
+
+# --- (Function 2) Extract Author Counts ---
+def extract_messages_per_person(filepath, start_date=None, end_date=None, workers=1, use_cache=True):
+    return _scan_single(filepath, "authors", start_date, end_date, workers, use_cache)
 
 # --- (Function 3) Extract Daily Author Counts ---
-def extract_messages_per_person_per_day(filepath, start_date=None, end_date=None):
+def extract_messages_per_person_per_day(filepath, start_date=None, end_date=None, workers=1, use_cache=True):
     """
     Parses a chat file and counts messages per person, per day.
     Returns: {date: {author: count, ...}, ...}
     """
-    daily_author_counts = defaultdict(lambda: defaultdict(int))
-    date_format = "%d/%m/%Y"
-    print("\nProcessing file for daily author counts...")
-
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                date_obj, author = parse_line(line, date_format)
-                if author and filter_by_date(date_obj, start_date, end_date):
-                    daily_author_counts[date_obj][author] += 1
-        
-        print(f"File processed. Found data across {len(daily_author_counts)} days.")
-        return daily_author_counts
-    except FileNotFoundError:
-        print(f"Error: The file '{filepath}' was not found.")
-        return None
-    except Exception as e:
-        print(f"An error occurred while reading the file: {e}")
-        return None
\ No newline at end of file
+    return _scan_single(filepath, "author_daily", start_date, end_date, workers, use_cache)
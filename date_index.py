@@ -0,0 +1,84 @@
+import bisect
+import json
+import os
+from pathlib import Path
+from helpers import file_fingerprint
+
+# --- Configuration ---
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+# ---------------------
+
+class DateIndex:
+    """
+    Sparse index of a chronological export: the byte offset of the first
+    dated line of every day. A date-filtered query can seek straight to the
+    start date and stop at the first day after the end date.
+    """
+
+    def __init__(self, days, offsets, size):
+        self.days = days       # date ordinals, ascending
+        self.offsets = offsets # byte offset where each day starts
+        self.size = size       # file size the index was built for
+
+    @classmethod
+    def from_day_starts(cls, day_starts, size):
+        """
+        Builds the index from LineScanner day_starts. Returns None if the
+        dates are not in chronological order, since seeking would skip lines.
+        """
+        days = [day for day, _ in day_starts]
+        if any(later <= earlier for earlier, later in zip(days, days[1:])):
+            return None
+        return cls(days, [offset for _, offset in day_starts], size)
+
+    def byte_range(self, start_date=None, end_date=None):
+        """Returns (start, end) byte offsets covering every line dated in [start_date, end_date]."""
+        start = 0
+        end = self.size
+        if start_date:
+            i = bisect.bisect_left(self.days, start_date.toordinal())
+            start = self.offsets[i] if i < len(self.days) else self.size
+        if end_date:
+            i = bisect.bisect_right(self.days, end_date.toordinal())
+            end = self.offsets[i] if i < len(self.days) else self.size
+        return start, max(start, end)
+
+def index_path_for(filepath):
+    """The index lives next to the export: 'chat.txt' -> 'chat.txt.index.json'."""
+    path = Path(filepath)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+def load_date_index(filepath, fingerprint=None):
+    """Returns the saved DateIndex if it was built for this version of the file, else None."""
+    try:
+        with open(index_path_for(filepath), 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if saved.get("version") != INDEX_VERSION:
+        return None
+    if saved.get("fingerprint") != (fingerprint or file_fingerprint(filepath)):
+        return None
+    return DateIndex(saved["days"], saved["offsets"], saved["fingerprint"]["size"])
+
+def save_date_index(filepath, index, fingerprint=None):
+    path = index_path_for(filepath)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": INDEX_VERSION,
+            "fingerprint": fingerprint or file_fingerprint(filepath),
+            "days": index.days,
+            "offsets": index.offsets,
+        }, f)
+    os.replace(tmp_path, path)
+
+def merge_day_starts(parts):
+    """Concatenates day_starts from consecutive byte ranges, dropping repeats at the seams."""
+    merged = []
+    for day_starts in parts:
+        for day, offset in day_starts:
+            if not merged or merged[-1][0] != day:
+                merged.append((day, offset))
+    return merged
@@ -1,4 +1,8 @@
+import argparse
 import datetime
+import hashlib
+import os
+from pathlib import Path
 from collections import defaultdict
 
 def get_date_input(prompt_message):
@@ -19,6 +23,13 @@ def get_date_input(prompt_message):
         except ValueError:
             print(f"Invalid date format. Please use '{date_format}' or press Enter.")
             
+def date_arg(value, date_format="%d/%m/%Y"):
+    """argparse type for --start / --end dates."""
+    try:
+        return datetime.datetime.strptime(value, date_format).date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', use dd/mm/yyyy")
+
 def filter_by_date(date_obj, start_date, end_date):
     """Checks if a date is within the optional range."""
     if (start_date and date_obj < start_date) or \
@@ -26,31 +37,164 @@ def filter_by_date(date_obj, start_date, end_date):
         return False
     return True
 
-def parse_line(line, date_format):
+# --- Date parsing cache ---
+# A chat spanning several years only has a few thousand distinct date strings,
+# so date_str -> date results are memoized per format. Failed parses are cached
+# as None so continuation lines don't hit strptime again either.
+DATE_CACHE_SIZE = 4096
+_date_caches = defaultdict(dict)
+_MISSING = object()
+
+def _parse_date_str(date_str, date_format):
+    """Parses a date string without the cache. Returns a date or None."""
+    # Fast path for the fixed "dd/mm/yyyy" layout: plain int slicing instead
+    # of the generic strptime machinery.
+    if date_format == "%d/%m/%Y" and len(date_str) == 10 and \
+       date_str[2] == '/' and date_str[5] == '/' and \
+       date_str[:2].isdigit() and date_str[3:5].isdigit() and date_str[6:].isdigit():
+        try:
+            return datetime.date(int(date_str[6:]), int(date_str[3:5]), int(date_str[:2]))
+        except ValueError:
+            return None
+    try:
+        return datetime.datetime.strptime(date_str, date_format).date()
+    except ValueError:
+        return None
+
+def parse_date_cached(date_str, date_format):
+    """
+    Returns the date for date_str, using a bounded per-format cache.
+    Returns None if date_str does not match date_format.
+    """
+    if len(date_str) > 64:
+        return _parse_date_str(date_str, date_format) # Too long to be a date, don't cache
+    cache = _date_caches[date_format]
+    date_obj = cache.get(date_str, _MISSING)
+    if date_obj is _MISSING:
+        date_obj = _parse_date_str(date_str, date_format)
+        if len(cache) >= DATE_CACHE_SIZE:
+            cache.clear()
+        cache[date_str] = date_obj
+    return date_obj
+
+def parse_line(line, date_format, with_time=False):
     """
     Helper function to parse a single line.
     Returns (date_obj, author) or (None, None) if invalid.
+    With with_time=True, returns (date_obj, author, minute_of_day) or
+    (None, None, None); minute_of_day is None if the time can't be read.
     """
-    try:
-        # 1. Check for date
-        date_str = line.split(',')[0]
-        date_obj = datetime.datetime.strptime(date_str, date_format).date()
-
-        # 2. Extract author
-        hyphen_index = line.find(' - ')
-        if hyphen_index == -1:
-            return None, None # Not a user message (e.g., multi-line)
-        
-        colon_index = line.find(':', hyphen_index + 3) # Find colon *after* hyphen
-        
-        if colon_index > hyphen_index:
-            # This is a user message: "date - author: message"
-            author = line[hyphen_index + 3 : colon_index].strip()
+    invalid = (None, None, None) if with_time else (None, None)
+
+    # 1. Check for date
+    comma_index = line.find(',')
+    date_str = line[:comma_index] if comma_index != -1 else line
+    date_obj = parse_date_cached(date_str, date_format)
+    if date_obj is None:
+        return invalid # Failed date parsing (e.g., multi-line)
+
+    # 2. Extract author
+    hyphen_index = line.find(' - ')
+    if hyphen_index == -1:
+        return invalid # Not a user message (e.g., multi-line)
+
+    colon_index = line.find(':', hyphen_index + 3) # Find colon *after* hyphen
+
+    if colon_index > hyphen_index:
+        # This is a user message: "date - author: message"
+        author = line[hyphen_index + 3 : colon_index].strip()
+        if not with_time:
             return date_obj, author
-        else:
-            return None, None # System message (e.g., "User left")
-            
-    except ValueError:
-        return None, None # Failed date parsing (e.g., multi-line)
-    except IndexError:
-        return None, None # Malformed line
\ No newline at end of file
+        # 3. Keep the "hh:mm" between the comma and the hyphen
+        minute = parse_time_str(line[comma_index + 1 : hyphen_index]) if comma_index < hyphen_index else None
+        return date_obj, author, minute
+    else:
+        return invalid # System message (e.g., "User left")
+
+# --- Time parsing cache ---
+# There are only 1440 distinct "hh:mm" strings (plus their am/pm variants).
+_time_cache = {}
+
+def parse_time_str(time_str):
+    """
+    Converts "hh:mm" or "h:mm am/pm" to minutes since midnight.
+    Returns None if the string is not a time.
+    """
+    minutes = _time_cache.get(time_str, _MISSING)
+    if minutes is _MISSING:
+        minutes = None
+        clock, _, meridiem = time_str.replace('\u202f', ' ').strip().partition(' ')
+        hours, sep, mins = clock.partition(':')
+        if sep and hours.isdigit() and mins.isdigit():
+            hours, mins = int(hours), int(mins)
+            meridiem = meridiem.strip().lower().replace('.', '')
+            if meridiem in ('am', 'pm'):
+                hours = hours % 12 + (12 if meridiem == 'pm' else 0)
+            elif meridiem:
+                hours = 24 # Unknown suffix, rejected below
+            if hours < 24 and mins < 60:
+                minutes = hours * 60 + mins
+        if len(_time_cache) >= DATE_CACHE_SIZE:
+            _time_cache.clear()
+        _time_cache[time_str] = minutes
+    return minutes
+
+# --- Byte-range reading (used by incremental and parallel parsing) ---
+CHUNKS_PER_WORKER = 4 # More chunks than workers keeps a pool busy when chunks run unevenly
+
+def split_ranges(filepath, chunks, start=0, end=None):
+    """
+    Splits bytes [start, end) of a file (end=None: to the end) into at most
+    `chunks` byte ranges [(start, end), ...] whose boundaries fall just after
+    a newline, so no line is cut in two. start must be a line boundary.
+    """
+    size = os.path.getsize(filepath) if end is None else end
+    if size <= start:
+        return []
+    step = max(1, -(-(size - start) // max(1, chunks)))
+    boundaries = [start]
+    with open(filepath, 'rb') as f:
+        while boundaries[-1] + step < size:
+            f.seek(boundaries[-1] + step)
+            f.readline() # Skip to the end of the current line
+            position = f.tell()
+            if position >= size:
+                break
+            boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+# --- File fingerprints (keys for the sidecar caches next to an export) ---
+FINGERPRINT_BYTES = 64 * 1024 # Hashed from both the head and the tail of the file
+CUBE_SUFFIX = ".cube.npz"     # Prefix cube sidecar (prefix_cube.py); named here so callers can check for it without numpy
+CACHE_SUFFIX = ".cache"       # Parse cache folder (parse_cache.py); likewise
+
+def sidecar_path(filepath, suffix):
+    """A file stored next to the export: ('chat.txt', '.cube.npz') -> 'chat.txt.cube.npz'."""
+    path = Path(filepath)
+    return path.with_name(path.name + suffix)
+
+def hash_range(f, start, end):
+    """SHA-1 of bytes [start, end) of an open binary file."""
+    f.seek(start)
+    return hashlib.sha1(f.read(end - start)).hexdigest()
+
+def file_fingerprint(filepath):
+    """
+    Identifies one version of an export by path, size, mtime and a hash of
+    its first and last FINGERPRINT_BYTES.
+    """
+    path = Path(filepath).resolve()
+    stat = path.stat()
+    digest = hashlib.sha1()
+    with path.open('rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if stat.st_size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, stat.st_size - FINGERPRINT_BYTES))
+            digest.update(f.read())
+    return {
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": digest.hexdigest(),
+    }
@@ -0,0 +1,170 @@
+"""
+Opt-in instrumentation for the analyzer's pipelines.
+
+Disabled by default. In that state stage() returns a shared no-op and
+enabled() is False, so instrumented code pays one global lookup per stage,
+never per line. Once enable() has been called, each stage records:
+- wall time
+- calls
+- item counts: lines, messages, and rejected lines by reason
+- the peak RSS seen at its end
+
+report() returns everything as a JSON-ready dict. enable(profile=True)
+also runs cProfile and enable(trace_memory=True) runs tracemalloc. Both
+are reported alongside the stages.
+
+    import instrumentation
+    instrumentation.enable()
+    with instrumentation.stage("scan") as s:
+        ...
+        s.add(lines=n_lines, rejected_continuation=n_continuations)
+    instrumentation.write_report("report.json")
+"""
+import json
+import sys
+import time
+
+# --- Configuration ---
+PROFILE_TOP = 25 # Functions listed in the report's cProfile summary
+# ---------------------
+
+_active = None
+
+class _NullStage:
+    """What stage() returns while instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder._finish(self.name, time.perf_counter() - self.start)
+        return False
+
+    def add(self, **counts):
+        self.recorder.add(self.name, **counts)
+
+class Recorder:
+    """Collects stage timings and counts for one run."""
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.profiler = None
+        self.trace_memory = trace_memory
+        if trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def _entry(self, name):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {"calls": 0, "seconds": 0.0, "counts": {}}
+        return entry
+
+    def _finish(self, name, seconds):
+        entry = self._entry(name)
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        entry["peak_rss_mb"] = peak_rss_mb()
+
+    def add(self, name, **counts):
+        totals = self._entry(name)["counts"]
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def stop(self):
+        """Stops cProfile / tracemalloc and returns the report."""
+        report = {
+            "total_seconds": time.perf_counter() - self.started,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+        }
+        if self.trace_memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {
+                "peak_mb": peak / 2**20,
+                "current_mb": current / 2**20,
+                "top": [str(stat) for stat in tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_TOP]],
+            }
+            tracemalloc.stop()
+        if self.profiler is not None:
+            self.profiler.disable()
+            report["profile"] = _profile_summary(self.profiler)
+        return report
+
+def _profile_summary(profiler):
+    import pstats
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": f"{filename}:{line}({function})", "calls": calls,
+                     "own_seconds": own, "cumulative_seconds": cumulative})
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:PROFILE_TOP]
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB (None where resource is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KiB elsewhere
+
+# --- Module API ---
+def enable(profile=False, trace_memory=False):
+    global _active
+    _active = Recorder(profile, trace_memory)
+
+def enabled():
+    return _active is not None
+
+def stage(name):
+    """Context manager timing one pipeline stage; a no-op unless enabled."""
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name)
+
+def add(name, **counts):
+    """Adds counts to a stage without timing it (e.g. merged from worker processes)."""
+    if _active is not None:
+        _active.add(name, **counts)
+
+def report():
+    """Stops recording and returns the report dict (None if instrumentation was off)."""
+    global _active
+    if _active is None:
+        return None
+    result = _active.stop()
+    _active = None
+    return result
+
+def write_report(path):
+    result = report()
+    if result is None:
+        return None
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    return result
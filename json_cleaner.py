@@ -1,13 +1,27 @@
+from array import array
+import argparse
+import bisect
+import heapq
 import json
+import os
+import tempfile
 from datetime import datetime, timezone
+from functools import lru_cache
+import numpy as np
 import pytz # You must install this library: pip install pytz
 
+import instrumentation
+from json_stream import iter_chat_messages
+from message_table import EPOCH_ORDINAL
+
 # --- Configuration ---
 INPUT_FILE = "Database/result/916204411717swhatsappnet.json"
 OUTPUT_FILE = "formatted_chat.json"
 AUTHOR_ME = "Milind"
 AUTHOR_THEM = "Ojou sama"
 TIMEZONE_IST = pytz.timezone('Asia/Kolkata')
+SORT_RUN_SIZE = 100_000 # Messages per in-memory sort run in streaming mode
+CONVERT_BATCH_SIZE = 10_000 # Timestamps converted together by the batch path
 # ---------------------
 
 def convert_timestamp_to_iso_string(ts):
@@ -23,106 +37,572 @@ def convert_timestamp_to_iso_string(ts):
         print(f"Error converting timestamp {ts}: {e}")
         return None
 
-def process_chat_data(chat_data):
+# --- Batch timestamp conversion ---
+# Converting one message at a time builds two datetimes and calls pytz per
+# message. The batch functions below look UTC offsets up in the zone's
+# transition table with np.searchsorted and format with datetime64, while
+# producing exactly the same strings as convert_timestamp_to_iso_string.
+_FIRST_SECOND = int(datetime(1, 1, 2, tzinfo=timezone.utc).timestamp())    # Leaves room for any UTC offset
+_LAST_SECOND = int(datetime(9999, 12, 30, tzinfo=timezone.utc).timestamp())
+
+def _format_offset(offset):
+    """Formats a timedelta the way datetime.isoformat() does: +HH:MM[:SS]."""
+    seconds = int(offset.total_seconds())
+    sign = "-" if seconds < 0 else "+"
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}" + (f":{seconds:02d}" if seconds else "")
+
+@lru_cache(maxsize=None)
+def utc_offset_table(tz):
+    """
+    Returns (transition_seconds, offset_seconds, offset_strings) for a pytz
+    zone: offset i applies from transition_seconds[i] (Unix time) onwards.
+    Returns None for zones without a pytz transition table.
+    """
+    if isinstance(tz, pytz.tzinfo.DstTzInfo):
+        starts = [int(t.replace(tzinfo=timezone.utc).timestamp()) for t in tz._utc_transition_times]
+        offsets = [info[0] for info in tz._transition_info]
+    elif isinstance(tz, (pytz.tzinfo.StaticTzInfo, type(pytz.utc))):
+        starts = [_FIRST_SECOND]
+        offsets = [tz.utcoffset(datetime(2000, 1, 1))]
+    else:
+        return None
+    return (np.array(starts, dtype=np.int64),
+            np.array([int(o.total_seconds()) for o in offsets], dtype=np.int64),
+            np.array([_format_offset(o) for o in offsets]))
+
+def _split_timestamps(timestamps):
+    """
+    Splits Unix timestamps into whole seconds and microseconds with the same
+    rounding as datetime.fromtimestamp. Returns (seconds, micros, valid) where
+    valid marks the entries the vectorized path can handle.
+    """
+    values = np.asarray(timestamps)
+    if values.dtype.kind in "iu":
+        seconds = values.astype(np.int64)
+        micros = np.zeros(len(seconds), dtype=np.int64)
+    elif values.dtype.kind == "f":
+        finite = np.isfinite(values)
+        frac, whole = np.modf(np.where(finite, values, 0.0))
+        micros = np.round(frac * 1e6).astype(np.int64)
+        seconds = np.clip(whole, _FIRST_SECOND - 1, _LAST_SECOND + 1).astype(np.int64) # Out of range stays invalid
+        carry = micros >= 1_000_000
+        seconds[carry] += 1
+        micros[carry] -= 1_000_000
+        borrow = micros < 0
+        seconds[borrow] -= 1
+        micros[borrow] += 1_000_000
+        valid = finite & (seconds >= _FIRST_SECOND) & (seconds <= _LAST_SECOND)
+        return seconds, micros, valid
+    else:
+        return None
+    return seconds, micros, (seconds >= _FIRST_SECOND) & (seconds <= _LAST_SECOND)
+
+def _local_seconds(seconds, table):
+    starts, offsets, _ = table
+    index = np.maximum(np.searchsorted(starts, seconds, side="right") - 1, 0)
+    return seconds + offsets[index], index
+
+def convert_timestamps_to_iso_strings(timestamps, tz=TIMEZONE_IST):
+    """
+    Batch version of convert_timestamp_to_iso_string: converts a sequence
+    of Unix timestamps to ISO 8601 strings in `tz`. Entries the vectorized
+    path can't handle (non-numeric, out of range) go through the scalar
+    function, so the result is always identical to calling it per message.
+    """
+    timestamps = list(timestamps) if not isinstance(timestamps, np.ndarray) else timestamps
+    table = utc_offset_table(tz)
+    split = _split_timestamps(timestamps) if table is not None and len(timestamps) else None
+    if split is None:
+        return [convert_timestamp_to_iso_string(ts) for ts in timestamps]
+
+    seconds, micros, valid = split
+    local, index = _local_seconds(np.where(valid, seconds, 0), table)
+    text = np.datetime_as_string(local.astype("datetime64[s]"), unit="s")
+    fractional = micros != 0
+    if fractional.any():
+        text = np.where(fractional, np.char.add(text, np.char.mod(".%06d", micros)), text)
+    text = np.char.add(text, table[2][index]).tolist()
+
+    if not valid.all():
+        for i in np.flatnonzero(~valid):
+            text[i] = convert_timestamp_to_iso_string(timestamps[i])
+    return text
+
+def local_time_columns(timestamps, tz=TIMEZONE_IST):
+    """
+    Converts Unix timestamps to compact local-time columns:
+    (day, minute) as int32 date ordinals and int16 minutes since midnight,
+    the same encoding as message_table.MessageTable.
+    """
+    table = utc_offset_table(tz)
+    seconds = np.floor(np.asarray(timestamps, dtype=np.float64)).astype(np.int64)
+    local, _ = _local_seconds(seconds, table)
+    days, rest = np.divmod(local, 86400)
+    return (days + EPOCH_ORDINAL).astype(np.int32), (rest // 60).astype(np.int16)
+
+# --- Reply index ---
+_MISSING = object()
+
+class ReplyIndex:
+    """
+    key_id -> caption of every message, for resolving replies.
+
+    Built in one pass without keeping the raw messages: keys and captions
+    are UTF-8 encoded back to back into one bytearray (the arena), and each
+    entry is a row of four fixed-size arrays (key hash, arena offset, key
+    length, caption length), about 24 bytes plus the text itself, where
+    a dict holds a key str, a caption str and a hash table slot per entry.
+    Lookups binary search the sorted hashes and compare the key bytes, so
+    hash collisions can't return a wrong caption. As with a dict, a key_id
+    added twice resolves to the caption added last.
+    """
+
+    _NONE = -1  # Caption length of a None caption
+    _OTHER = -2 # Caption that isn't a str, kept in _other_captions
+
+    def __init__(self):
+        self._hashes = array("q")
+        self._offsets = array("q")
+        self._key_lengths = array("i")
+        self._caption_lengths = array("i")
+        self._arena = bytearray()
+        self._other_captions = {}
+        self._other_keys = {} # key_ids that aren't str (not seen in real dumps)
+        self._sorted = None   # (sorted hashes, entry numbers) once a lookup needs them
+
+    @classmethod
+    def from_messages(cls, messages):
+        index = cls()
+        for msg in messages:
+            index.add_message(msg)
+        return index
+
+    def add_message(self, msg):
+        """Indexes msg's caption under its key_id, if it has one."""
+        key_id = msg.get("key_id")
+        if key_id:
+            self.add(key_id, msg.get("caption"))
+
+    def add(self, key_id, caption):
+        if not isinstance(key_id, str):
+            self._other_keys[key_id] = caption
+            return
+        key = key_id.encode("utf-8", "surrogatepass") # json allows lone surrogates (\ud800) in strings
+        self._hashes.append(hash(key))
+        self._offsets.append(len(self._arena))
+        self._key_lengths.append(len(key))
+        if caption is None:
+            self._caption_lengths.append(self._NONE)
+        elif isinstance(caption, str):
+            text = caption.encode("utf-8", "surrogatepass")
+            self._caption_lengths.append(len(text))
+            key += text
+        else:
+            self._other_captions[len(self._hashes) - 1] = caption
+            self._caption_lengths.append(self._OTHER)
+        self._arena += key
+        self._sorted = None
+
+    def _sort(self):
+        """Returns (sorted hashes, entry numbers) as arrays, which bisect searches without numpy's per-call overhead."""
+        if self._sorted is None:
+            hashes = np.array(self._hashes, dtype=np.int64)
+            entries = np.argsort(hashes, kind="stable") # Equal hashes stay in insertion order
+            self._sorted = (array("q", hashes[entries].tobytes()), array("q", entries.astype(np.int64).tobytes()))
+        return self._sorted
+
+    def _caption(self, entry):
+        length = self._caption_lengths[entry]
+        if length == self._NONE:
+            return None
+        if length == self._OTHER:
+            return self._other_captions[entry]
+        start = self._offsets[entry] + self._key_lengths[entry]
+        return self._arena[start:start + length].decode("utf-8", "surrogatepass")
+
+    def get(self, key_id, default=None):
+        """Caption of the message with this key_id (may be None), or default if there is none."""
+        if not isinstance(key_id, str):
+            return self._other_keys.get(key_id, default)
+        hashes, entries = self._sort()
+        key = key_id.encode("utf-8", "surrogatepass")
+        key_hash = hash(key)
+        first = bisect.bisect_left(hashes, key_hash)
+        last = bisect.bisect_right(hashes, key_hash, first)
+        for entry in reversed(entries[first:last]): # Last added wins
+            if self._key_lengths[entry] == len(key) and self._key(entry) == key:
+                return self._caption(entry)
+        return default
+
+    def __contains__(self, key_id):
+        return self.get(key_id, _MISSING) is not _MISSING
+
+    def __getitem__(self, key_id):
+        caption = self.get(key_id, _MISSING)
+        if caption is _MISSING:
+            raise KeyError(key_id)
+        return caption
+
+    def _key(self, entry):
+        start = self._offsets[entry]
+        return self._arena[start:start + self._key_lengths[entry]]
+
+    def __len__(self):
+        """Distinct key_ids."""
+        hashes, entries = self._sort()
+        hashes = np.frombuffer(hashes, dtype=np.int64)
+        entries = np.frombuffer(entries, dtype=np.int64)
+        repeated = np.flatnonzero(hashes[1:] == hashes[:-1])
+        if not len(repeated):
+            return len(hashes) + len(self._other_keys)
+        shared = np.isin(hashes, hashes[repeated])
+        keys = {}
+        for entry in entries[shared].tolist():
+            keys.setdefault(self._hashes[entry], set()).add(bytes(self._key(entry)))
+        distinct = len(hashes) - int(np.count_nonzero(shared)) + sum(len(group) for group in keys.values())
+        return distinct + len(self._other_keys)
+
+    def nbytes(self):
+        """Approximate memory held by the index."""
+        arrays = (self._hashes, self._offsets, self._key_lengths, self._caption_lengths)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self._arena)
+
+# --- Formatting ---
+class FormattedMessage:
+    """One output message. A slotted record takes well under half the memory of the equivalent dict."""
+
+    __slots__ = ("author", "timestamp", "text", "media", "reply_to")
+
+    def __init__(self, author, timestamp, text, media, reply_to):
+        self.author = author
+        self.timestamp = timestamp
+        self.text = text
+        self.media = media
+        self.reply_to = reply_to
+
+    def as_list(self):
+        return [self.author, self.timestamp, self.text, self.media, self.reply_to]
+
+    def as_dict(self):
+        """The message as written to the output file, keys in output order."""
+        return {"author": self.author, "timestamp": self.timestamp, "text": self.text,
+                "media": self.media, "reply_to": self.reply_to}
+
+def format_message(msg, reply_captions, iso_timestamp=None):
+    """
+    Transforms one raw message into a FormattedMessage.
+    reply_captions maps key_id -> caption for every message that has a
+    key_id (a ReplyIndex, or any mapping with get()).
+    iso_timestamp is the already converted timestamp, if the caller batched it.
+    Returns None for messages that should be dropped.
+    """
+    # Filter out messages without a timestamp (e.g., metadata)
+    if not msg.get("timestamp"):
+        return None
+
+    # 1. Convert author
+    author = AUTHOR_ME if msg.get("from_me") else AUTHOR_THEM
+
+    # 2. Convert timestamp to ISO 8601 format
+    if iso_timestamp is None:
+        iso_timestamp = convert_timestamp_to_iso_string(msg["timestamp"])
+
+    # 3. --- NEW: Consolidate 'data' and 'caption' into 'text' ---
+    data_content = msg.get("data")
+    caption_content = msg.get("caption")
+
+    # Prioritize 'data', but fall back to 'caption'
+    text = data_content if data_content is not None else caption_content
+    media = msg.get("media", False)
+
+    # 4. Handle replies and rename "quoted_data" to "reply_to"
+    reply_key = msg.get("reply")
+    quoted_data = msg.get("quoted_data")
+    reply_to_content = None
+
+    if reply_key:
+        if quoted_data:
+            reply_to_content = quoted_data
+        else:
+            # The content we want is the *caption* of the original message
+            reply_to_content = reply_captions.get(reply_key, _MISSING)
+            if reply_to_content is _MISSING:
+                reply_to_content = "[Replied to a message that could not be found]"
+            elif not reply_to_content:
+                reply_to_content = "[Replied to a media message]"
+
+    # 5. --- NEW: Aggressive filtering ---
+    # Skip any message that has no text, no media, and no reply context
+    if not text and not media and not reply_to_content:
+        return None # Skip this "empty" message
+
+    return FormattedMessage(author, iso_timestamp, text, media, reply_to_content)
+
+def format_messages(messages, reply_captions, batch_size=CONVERT_BATCH_SIZE):
+    """
+    Formats raw messages in order, converting their timestamps in batches.
+    Yields (raw_message, formatted_message) for messages that are kept.
+    """
+    batch = []
+    dropped = 0
+    for msg in messages:
+        if msg.get("timestamp"):
+            batch.append(msg)
+        else:
+            dropped += 1
+        if len(batch) >= batch_size:
+            yield from _format_batch(batch, reply_captions)
+            batch = []
+    yield from _format_batch(batch, reply_captions)
+    instrumentation.add("json_cleaner.format", rejected_no_timestamp=dropped)
+
+def _format_batch(batch, reply_captions):
+    with instrumentation.stage("json_cleaner.convert_timestamps") as stage:
+        iso_timestamps = convert_timestamps_to_iso_strings([msg["timestamp"] for msg in batch])
+        stage.add(messages=len(batch))
+    for msg, iso_timestamp in zip(batch, iso_timestamps):
+        new_msg = format_message(msg, reply_captions, iso_timestamp)
+        if new_msg is not None:
+            yield msg, new_msg
+
+def process_chat_data(chat_data, consume=False):
     """
-    Processes the raw chat dictionary into a formatted list of messages.
+    Processes the raw chat dictionary into a chronological list of
+    FormattedMessage. With consume=True, raw messages are removed from
+    chat_data as they are formatted, so the raw dump is freed while the
+    output is built instead of being held until the end.
     """
     
-    # First Pass: Build a map of all messages by their key_id.
+    # First Pass: Index the caption of every message by its key_id.
     # This is essential for looking up the content of replied-to messages.
-    key_id_to_message_map = {}
-    for msg in chat_data.values():
-        if "key_id" in msg and msg["key_id"]:
-            key_id_to_message_map[msg["key_id"]] = msg
+    with instrumentation.stage("json_cleaner.index") as stage:
+        reply_captions = ReplyIndex.from_messages(chat_data.values())
+        stage.add(index_bytes=reply_captions.nbytes())
 
     formatted_messages = []
     
     # Sort messages by timestamp to ensure the final list is chronological
-    try:
-        sorted_message_items = sorted(
-            chat_data.items(), 
-            key=lambda item: item[1].get("timestamp", 0)
-        )
-    except Exception as e:
-        print(f"Warning: Could not sort messages by timestamp. {e}")
-        sorted_message_items = chat_data.items()
+    with instrumentation.stage("json_cleaner.sort"):
+        try:
+            sorted_message_ids = sorted(chat_data, key=lambda message_id: chat_data[message_id].get("timestamp", 0))
+        except Exception as e:
+            print(f"Warning: Could not sort messages by timestamp. {e}")
+            sorted_message_ids = list(chat_data)
 
     # Second Pass: Transform each message
-    for _, msg in sorted_message_items:
-        
-        # Filter out messages without a timestamp (e.g., metadata)
-        if not msg.get("timestamp"):
-            continue 
+    with instrumentation.stage("json_cleaner.format") as stage:
+        take = chat_data.pop if consume else chat_data.__getitem__
+        raw_messages = (take(message_id) for message_id in sorted_message_ids)
+        for _, new_msg in format_messages(raw_messages, reply_captions):
+            formatted_messages.append(new_msg)
+        stage.add(messages=len(formatted_messages))
 
-        new_msg = {}
+    return formatted_messages
 
-        # 1. Convert author
-        new_msg["author"] = AUTHOR_ME if msg.get("from_me") else AUTHOR_THEM
+# --- Streaming mode ---
+# For databases too large for json.load: the dump is read twice with
+# json_stream, keeping only the ReplyIndex in memory, and
+# formatted messages are written out as they are produced.
 
-        # 2. Convert timestamp to ISO 8601 format
-        new_msg["timestamp"] = convert_timestamp_to_iso_string(msg["timestamp"])
+class JSONArrayWriter:
+    """Writes messages as a JSON array, formatted exactly like json.dump(..., indent=2)."""
 
-        # 3. --- NEW: Consolidate 'data' and 'caption' into 'text' ---
-        data_content = msg.get("data")
-        caption_content = msg.get("caption")
-        
-        # Prioritize 'data', but fall back to 'caption'
-        new_msg["text"] = data_content if data_content is not None else caption_content
-        new_msg["media"] = msg.get("media", False)
-        
-        # 4. Handle replies and rename "quoted_data" to "reply_to"
-        reply_key = msg.get("reply")
-        quoted_data = msg.get("quoted_data")
-        reply_to_content = None
-
-        if reply_key:
-            if quoted_data:
-                reply_to_content = quoted_data
-            else:
-                original_msg = key_id_to_message_map.get(reply_key)
-                if original_msg:
-                    # The content we want is the *caption* of the original message
-                    # (which is now in its 'text' field if we processed it,
-                    # but safer to look at the original data)
-                    reply_to_content = original_msg.get("caption")
-                    if not reply_to_content:
-                        reply_to_content = "[Replied to a media message]"
-                else:
-                    reply_to_content = "[Replied to a message that could not be found]"
-
-        new_msg["reply_to"] = reply_to_content
-            
-        # 5. --- NEW: Aggressive filtering ---
-        # Skip any message that has no text, no media, and no reply context
-        is_text_empty = not new_msg.get("text") # Checks for None or ""
-        is_media_false = not new_msg.get("media")
-        is_reply_to_empty = not new_msg.get("reply_to")
-        
-        if is_text_empty and is_media_false and is_reply_to_empty:
-            continue # Skip this "empty" message
-            
-        formatted_messages.append(new_msg)
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
 
-    return formatted_messages
+    def write(self, msg):
+        if isinstance(msg, FormattedMessage):
+            msg = msg.as_dict()
+        self.f.write("[\n  " if self.count == 0 else ",\n  ")
+        self.f.write(json.dumps(msg, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+        self.count += 1
+
+    def write_all(self, messages, batch_size=CONVERT_BATCH_SIZE):
+        """
+        Writes messages a batch at a time: one json.dumps of a list of
+        batch_size dicts is much cheaper than batch_size calls to write(),
+        and only one batch of dicts exists at a time.
+        """
+        batch = []
+        for msg in messages:
+            batch.append(msg.as_dict() if isinstance(msg, FormattedMessage) else msg)
+            if len(batch) >= batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        text = json.dumps(batch, indent=2, ensure_ascii=False) # "[\n  {...},\n  {...}\n]"
+        self.f.write(("[" if self.count == 0 else ",") + text[1:-2])
+        self.count += len(batch)
+
+    def close(self):
+        self.f.write("[]" if self.count == 0 else "\n]")
+
+class NDJSONWriter:
+    """Writes one compact JSON message per line."""
 
-def main():
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, msg):
+        if isinstance(msg, FormattedMessage):
+            msg = msg.as_dict()
+        self.f.write(json.dumps(msg, ensure_ascii=False))
+        self.f.write("\n")
+        self.count += 1
+
+    def write_all(self, messages):
+        for msg in messages:
+            self.write(msg)
+
+    def close(self):
+        pass
+
+WRITERS = {"json": JSONArrayWriter, "ndjson": NDJSONWriter}
+
+def iter_raw_messages(input_path):
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for _, _, msg in iter_chat_messages(f):
+            yield msg
+
+def index_chat_stream(input_path):
+    """
+    First streaming pass: builds the ReplyIndex and checks whether
+    messages are already in timestamp order.
+    Returns (reply_captions, message_count, is_sorted).
+    """
+    reply_captions = ReplyIndex()
+    count = 0
+    is_sorted = True
+    last_timestamp = None
+    for msg in iter_raw_messages(input_path):
+        count += 1
+        reply_captions.add_message(msg)
+        timestamp = msg.get("timestamp")
+        if timestamp:
+            if last_timestamp is not None and timestamp < last_timestamp:
+                is_sorted = False
+            last_timestamp = timestamp
+    return reply_captions, count, is_sorted
+
+def _write_sort_run(records, run_dir, run_number):
+    """Sorts one batch of (timestamp, sequence, FormattedMessage) and saves it as NDJSON."""
+    records.sort(key=lambda record: (record[0], record[1]))
+    path = os.path.join(run_dir, f"run_{run_number:05d}.ndjson")
+    with open(path, 'w', encoding='utf-8') as f:
+        for timestamp, sequence, msg in records:
+            f.write(json.dumps([timestamp, sequence, msg.as_list()], ensure_ascii=False))
+            f.write("\n")
+    return path
+
+def _read_sort_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            timestamp, sequence, fields = json.loads(line)
+            yield timestamp, sequence, FormattedMessage(*fields)
+
+def external_sort(records, run_size=SORT_RUN_SIZE, run_dir=None):
+    """
+    Sorts (timestamp, sequence, FormattedMessage) records that may not fit in memory:
+    batches of run_size are sorted into temporary files, which are then
+    merged lazily. Yields messages in (timestamp, sequence) order.
+    """
+    with tempfile.TemporaryDirectory(dir=run_dir, prefix="sort_runs_") as tmp_dir:
+        runs, batch = [], []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= run_size:
+                runs.append(_write_sort_run(batch, tmp_dir, len(runs)))
+                batch = []
+        if not runs:
+            # Everything fit in one batch: no temporary files needed
+            batch.sort(key=lambda record: (record[0], record[1]))
+            for record in batch:
+                yield record[2]
+            return
+        if batch:
+            runs.append(_write_sort_run(batch, tmp_dir, len(runs)))
+        merged = heapq.merge(*(_read_sort_run(path) for path in runs), key=lambda record: (record[0], record[1]))
+        for record in merged:
+            yield record[2]
+
+def process_chat_stream(input_path, output_path, output_format="json", run_size=SORT_RUN_SIZE):
+    """
+    Streams a msgstore dump into formatted messages without loading it whole.
+    Output is a JSON array (identical to the in-memory path) or NDJSON.
+    Messages are sorted by timestamp with an external merge sort if the
+    input isn't already in order.
+    Returns the number of messages written.
+    """
+    with instrumentation.stage("json_cleaner.stream_index") as stage:
+        reply_captions, count, is_sorted = index_chat_stream(input_path)
+        stage.add(messages=count, index_bytes=reply_captions.nbytes())
+    print(f"Indexed {count} messages ({len(reply_captions)} reply targets).")
+
+    def formatted():
+        kept = format_messages(iter_raw_messages(input_path), reply_captions)
+        for sequence, (msg, new_msg) in enumerate(kept):
+            yield msg["timestamp"], sequence, new_msg
+
+    if is_sorted:
+        messages = (record[2] for record in formatted())
+    else:
+        print("Messages are not in timestamp order, sorting with an external merge sort...")
+        run_dir = os.path.dirname(os.path.abspath(output_path))
+        messages = external_sort(formatted(), run_size, run_dir)
+
+    # Decoding, formatting, sorting and writing are one lazy pipeline, so they're timed together
+    with instrumentation.stage("json_cleaner.stream_format_write") as stage, \
+         open(output_path, 'w', encoding='utf-8') as f:
+        writer = WRITERS[output_format](f)
+        writer.write_all(messages)
+        writer.close()
+        stage.add(messages=writer.count, sorted_externally=int(not is_sorted))
+    return writer.count
+
+def main(argv=None):
     """
     Main function to load, process, and save the chat data.
     """
+    parser = argparse.ArgumentParser(description="Format a decrypted WhatsApp msgstore JSON dump.")
+    parser.add_argument("-i", "--input", default=INPUT_FILE, help=f"Input dump (default: '{INPUT_FILE}')")
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE, help=f"Output file (default: '{OUTPUT_FILE}')")
+    parser.add_argument("--stream", action="store_true", help="Stream the dump instead of loading it into memory")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="json", help="Output format in streaming mode (default: json)")
+    args = parser.parse_args(argv)
+
+    if args.stream:
+        try:
+            written = process_chat_stream(args.input, args.output, args.format)
+        except FileNotFoundError:
+            print(f"Error: Input file '{args.input}' not found.")
+            return
+        except json.JSONDecodeError:
+            print(f"Error: Could not decode JSON from '{args.input}'.")
+            return
+        print(f"Successfully processed and saved {written} messages to '{args.output}'.")
+        return
+
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+        with instrumentation.stage("json_cleaner.load"), open(args.input, 'r', encoding='utf-8') as f:
             data = json.load(f)
     except FileNotFoundError:
-        print(f"Error: Input file '{INPUT_FILE}' not found.")
+        print(f"Error: Input file '{args.input}' not found.")
         return
     except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{INPUT_FILE}'.")
+        print(f"Error: Could not decode JSON from '{args.input}'.")
         return
     except Exception as e:
         print(f"An error occurred while reading the file: {e}")
         return
 
-    print(f"Loaded data from '{INPUT_FILE}'.")
+    print(f"Loaded data from '{args.input}'.")
 
     if not isinstance(data, dict) or not data:
         print(f"Error: Expected a non-empty JSON object, but got {type(data)}")
@@ -148,18 +628,21 @@ def main():
     
     print(f"Found {len(message_data)} messages for chat {first_key}.")
     
-    # Process the data
-    formatted_data = process_chat_data(message_data)
+    # Process the data, freeing raw messages as they are formatted
+    del data, chat_content
+    formatted_data = process_chat_data(message_data, consume=True)
     
-    # Save the new formatted data
+    # Save the new formatted data (byte-identical to json.dump(..., indent=2))
     try:
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(formatted_data, f, indent=2, ensure_ascii=False)
+        with instrumentation.stage("json_cleaner.write"), open(args.output, 'w', encoding='utf-8') as f:
+            writer = JSONArrayWriter(f)
+            writer.write_all(formatted_data)
+            writer.close()
     except Exception as e:
         print(f"An error occurred while writing the file: {e}")
         return
 
-    print(f"Successfully processed and saved formatted data to '{OUTPUT_FILE}'.")
+    print(f"Successfully processed and saved formatted data to '{args.output}'.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,133 @@
+import json
+
+# --- Configuration ---
+READ_SIZE = 1024 * 1024 # Characters read from the file per refill
+# ---------------------
+
+_WHITESPACE = " \t\n\r"
+# A value cut off by the end of the buffer fails this close to it (e.g. "fals", "\u12");
+# "Unterminated string" errors point at the string's start instead
+_TRUNCATION_MARGIN = 16
+
+class JSONStreamReader:
+    """
+    Incremental reader for large JSON documents. Walks objects and arrays one
+    member at a time and decodes each member value with json's raw_decode,
+    so only the current member is held in memory.
+    """
+
+    def __init__(self, f, read_size=READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, minimum=1):
+        """Makes sure at least `minimum` unread characters are buffered. Returns False at EOF."""
+        while len(self.buffer) - self.pos < minimum and not self.eof:
+            chunk = self.f.read(max(self.read_size, minimum))
+            if not chunk:
+                self.eof = True
+            self.buffer = self.buffer[self.pos:] + chunk
+            self.pos = 0
+        return len(self.buffer) - self.pos >= minimum
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            if not self._fill():
+                return ""
+            char = self.buffer[self.pos]
+            if char not in _WHITESPACE:
+                return char
+            self.pos += 1
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Decodes and returns the next complete JSON value."""
+        self.peek()
+        need = self.read_size
+        while True:
+            try:
+                result, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Only a value cut off by the buffer end is worth reading more for;
+                # a syntax error elsewhere would otherwise buffer the rest of the file
+                truncated = e.pos >= len(self.buffer) - _TRUNCATION_MARGIN or e.msg.startswith("Unterminated string")
+                if self.eof or not truncated:
+                    raise
+            else:
+                # A number that ends exactly at the end of the buffer might continue
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return result
+            self._fill(len(self.buffer) - self.pos + need)
+            need *= 2
+
+    def skip(self):
+        """Skips the next JSON value."""
+        self.value()
+
+    def items(self):
+        """Iterates (key, value) over the members of the object at the current position."""
+        for key in self.keys():
+            yield key, self.value()
+
+    def keys(self):
+        """
+        Iterates the keys of the object at the current position. After each
+        key the reader sits on its value, which the caller must consume with
+        value(), skip(), keys() or elements().
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", self.buffer, self.pos - 1)
+
+    def elements(self):
+        """Iterates the values of the array at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", self.buffer, self.pos - 1)
+
+def iter_chat_messages(f):
+    """
+    Streams the messages of the first chat in a msgstore-style dump:
+    {"<chat id>": {..., "messages": {"<id>": {...}, ...}}, ...}
+    Yields (chat_id, message_id, message) without loading the dump.
+    """
+    reader = JSONStreamReader(f)
+    for chat_id in reader.keys():
+        for key in reader.keys():
+            if key == "messages":
+                for message_id, message in reader.items():
+                    yield chat_id, message_id, message
+            else:
+                reader.skip()
+        return # Only the first chat, like json_cleaner.main
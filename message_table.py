@@ -0,0 +1,300 @@
+from array import array
+import datetime
+import os
+import numpy as np
+from helpers import CHUNKS_PER_WORKER, split_ranges
+from scanner import LineScanner, char_count, open_mmap
+
+# Day columns hold proleptic Gregorian ordinals (date.toordinal()).
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+MAX_LENGTH = np.iinfo(np.uint16).max
+NO_TIME = -1
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+class MessageTable:
+    """
+    Columnar, NumPy-backed view of a parsed chat: one row per user message.
+
+    Columns:
+        day     int32   date ordinal
+        author  int16   index into `authors`
+        minute  int16   minutes since midnight, or NO_TIME
+        length  uint16  characters of message text (continuation lines included, clipped)
+    """
+
+    def __init__(self, day, author, minute, length, authors, chronological=None):
+        self.day = day
+        self.author = author
+        self.minute = minute
+        self.length = length
+        self.authors = authors
+        self._chronological = chronological
+
+    def __len__(self):
+        return len(self.day)
+
+    @property
+    def nbytes(self):
+        return self.day.nbytes + self.author.nbytes + self.minute.nbytes + self.length.nbytes
+
+    def is_chronological(self):
+        """True if rows are ordered by day (exports normally are). Computed once per table."""
+        if self._chronological is None:
+            self._chronological = bool(np.all(self.day[1:] >= self.day[:-1]))
+        return self._chronological
+
+    def select(self, start_date=None, end_date=None):
+        """Returns a new table with only the rows inside the optional date range."""
+        if not start_date and not end_date:
+            return self
+        if self.is_chronological():
+            # Binary search for the row range; slices share memory with this table
+            first = np.searchsorted(self.day, start_date.toordinal(), 'left') if start_date else 0
+            last = np.searchsorted(self.day, end_date.toordinal(), 'right') if end_date else len(self)
+            rows = slice(first, max(first, last))
+            return MessageTable(self.day[rows], self.author[rows], self.minute[rows],
+                                self.length[rows], self.authors, chronological=True)
+        mask = np.ones(len(self), dtype=bool)
+        if start_date:
+            mask &= self.day >= start_date.toordinal()
+        if end_date:
+            mask &= self.day <= end_date.toordinal()
+        return MessageTable(self.day[mask], self.author[mask], self.minute[mask],
+                            self.length[mask], self.authors)
+
+    def _day_index(self):
+        """Returns (day ordinals with messages, row -> position in that list)."""
+        if not len(self):
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.intp)
+        first = int(self.day.min())
+        per_day = np.bincount(self.day - first)
+        present = np.flatnonzero(per_day)
+        position = np.cumsum(per_day > 0) - 1
+        return (present + first).astype(np.int32), position[self.day - first]
+
+    # --- Aggregates ---
+    def daily_counts(self):
+        """Returns (dates, counts) for every day that has messages."""
+        days, positions = self._day_index()
+        return ordinals_to_datetime64(days), np.bincount(positions, minlength=len(days))
+
+    def author_counts(self):
+        """Returns (authors, counts) for every author that has messages."""
+        counts = np.bincount(self.author, minlength=len(self.authors))
+        present = np.flatnonzero(counts)
+        return [self.authors[i] for i in present], counts[present]
+
+    def author_day_matrix(self):
+        """Returns (dates, authors, matrix) where matrix[author, day] is a message count."""
+        days, positions = self._day_index()
+        counts = np.bincount(self.author.astype(np.intp) * len(days) + positions,
+                             minlength=len(self.authors) * len(days))
+        matrix = counts.reshape(len(self.authors), len(days))
+        present = np.flatnonzero(matrix.sum(axis=1))
+        return ordinals_to_datetime64(days), [self.authors[i] for i in present], matrix[present]
+
+    def _hours(self):
+        """Returns (rows that have a time, their hour of day)."""
+        timed = np.flatnonzero(self.minute != NO_TIME)
+        return timed, (self.minute[timed] // 60).astype(np.intp)
+
+    def hour_weekday_matrix(self):
+        """Returns (WEEKDAYS, matrix) where matrix[weekday, hour] is a message count; rows without a time are skipped."""
+        timed, hours = self._hours()
+        weekdays = (self.day[timed].astype(np.intp) - 1) % 7 # Ordinal 1 (0001-01-01) was a Monday
+        counts = np.bincount(weekdays * 24 + hours, minlength=7 * 24)
+        return list(WEEKDAYS), counts.reshape(7, 24)
+
+    def author_hour_matrix(self):
+        """Returns (authors, matrix) where matrix[author, hour] is a message count; rows without a time are skipped."""
+        timed, hours = self._hours()
+        counts = np.bincount(self.author[timed].astype(np.intp) * 24 + hours, minlength=len(self.authors) * 24)
+        matrix = counts.reshape(len(self.authors), 24)
+        present = np.flatnonzero(matrix.sum(axis=1))
+        return [self.authors[i] for i in present], matrix[present]
+
+    # --- Dict views (same shape as data_extraction's results) ---
+    def daily_dict(self):
+        dates, counts = self.daily_counts()
+        return dict(zip(datetime64_to_dates(dates), counts.tolist()))
+
+    def author_dict(self):
+        authors, counts = self.author_counts()
+        return dict(zip(authors, counts.tolist()))
+
+    def author_day_dict(self):
+        dates, authors, matrix = self.author_day_matrix()
+        result = {}
+        for date_obj, column in zip(datetime64_to_dates(dates), matrix.T.tolist()):
+            result[date_obj] = {a: c for a, c in zip(authors, column) if c}
+        return result
+
+    def hour_weekday_dict(self):
+        weekdays, matrix = self.hour_weekday_matrix()
+        return dict(zip(weekdays, matrix.tolist()))
+
+    def author_hour_dict(self):
+        authors, matrix = self.author_hour_matrix()
+        return dict(zip(authors, matrix.tolist()))
+
+def ordinals_to_datetime64(ordinals):
+    return (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+
+def datetime64_to_dates(values):
+    return [datetime.date.fromordinal(int(d) + EPOCH_ORDINAL) for d in values.astype(np.int64)]
+
+class MessageTableBuilder:
+    """Accumulates scanned lines into compact arrays, then freezes them into a MessageTable."""
+
+    def __init__(self):
+        self.day = array('i')
+        self.author = array('h')
+        self.minute = array('h')
+        self.length = array('i')
+        self.authors = []
+        self.author_codes = {}
+        # None until the first dated line: continuation lines before it belong
+        # to a message parsed elsewhere (previous chunk or previous ingest).
+        self.in_message = None
+        self.leading_length = 0
+
+    def add_scanned(self, records):
+        """
+        Adds the records of LineScanner.scan() (the ingestion hot loop):
+        - user message: a new row; length is the body's characters, without
+          surrounding spaces and line endings
+        - continuation line: adds "\n" + the line's characters to the row
+          above; before the first dated line of a range it counts towards
+          leading_length instead (the message started in an earlier range)
+        - system line ("User left"): ends the message, so the continuation
+          lines after it are ignored
+        """
+        day_append, author_append = self.day.append, self.author.append
+        minute_append, length_append = self.minute.append, self.length.append
+        author_codes, length = self.author_codes, self.length
+        in_message = self.in_message
+        for date_obj, minute, author, line, body_start in records:
+            if author:
+                code = author_codes.get(author)
+                if code is None:
+                    code = author_codes[author] = len(self.authors)
+                    self.authors.append(author)
+                day_append(date_obj.toordinal())
+                author_append(code)
+                minute_append(NO_TIME if minute is None else minute)
+                length_append(char_count(line[body_start:].strip(b" \r\n")))
+                in_message = True
+            elif date_obj is None:
+                if in_message:
+                    length[-1] += 1 + char_count(line)
+                elif in_message is None:
+                    self.leading_length += 1 + char_count(line)
+            else:
+                in_message = False
+        self.in_message = in_message
+
+    def build(self):
+        length = np.minimum(np.frombuffer(self.length, dtype=np.int32), MAX_LENGTH).astype(np.uint16)
+        return MessageTable(
+            np.frombuffer(self.day, dtype=np.int32).copy(),
+            np.frombuffer(self.author, dtype=np.int16).copy(),
+            np.frombuffer(self.minute, dtype=np.int16).copy(),
+            length,
+            list(self.authors),
+        )
+
+class TablePart:
+    """A MessageTable parsed from one byte range of an export, plus the state needed to join it."""
+
+    def __init__(self, table, leading_length=0, ends_in_message=None, end_offset=0):
+        self.table = table
+        self.leading_length = leading_length   # continuation chars owed to the previous part
+        self.ends_in_message = ends_in_message # last line is part of a user message (None: no dated lines)
+        self.end_offset = end_offset           # byte offset just after the part
+
+def parse_range(filepath, start=0, end=None, date_format="%d/%m/%Y"):
+    """
+    Parses bytes [start, end) of a chat file (end=None: to the current end of
+    the file). start and end must fall on line boundaries.
+    The file is memory-mapped and scanned as bytes; message text is never
+    decoded, only measured.
+    Returns a TablePart.
+    """
+    builder = MessageTableBuilder()
+    with open_mmap(filepath) as buf:
+        end = len(buf) if end is None else end
+        builder.add_scanned(LineScanner(date_format).scan(buf, start, end))
+    return TablePart(builder.build(), builder.leading_length, builder.in_message, end)
+
+def _parse_range_worker(args):
+    return parse_range(*args)
+
+def parse_parallel(filepath, workers=None, date_format="%d/%m/%Y"):
+    """
+    Parses a chat file into a MessageTable using a pool of worker processes.
+    The file is split into line-aligned byte ranges, each parsed with the same
+    rules as the serial path, and the partial tables are joined in file order.
+    workers=None uses every CPU.
+    Returns a TablePart covering the whole file.
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = split_ranges(filepath, workers * CHUNKS_PER_WORKER)
+    if workers == 1 or len(ranges) <= 1:
+        return parse_range(filepath, date_format=date_format)
+    from concurrent.futures import ProcessPoolExecutor # Deferred: ~25ms to import
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_parse_range_worker, [(filepath, start, end, date_format) for start, end in ranges]))
+    ends_in_message = next((p.ends_in_message for p in reversed(parts) if p.ends_in_message is not None), None)
+    return TablePart(join_parts(parts), parts[0].leading_length, ends_in_message, ranges[-1][1])
+
+def join_parts(parts):
+    """
+    Joins TableParts parsed from consecutive byte ranges of one export into a
+    single MessageTable. Author dictionaries are merged, and continuation lines
+    at the start of a part are added to the last message of the part before.
+    """
+    authors, codes = [], {}
+    columns = {"day": [], "author": [], "minute": [], "length": []}
+    owed = {} # row index -> continuation chars to add to its length
+    rows = 0
+    previous_in_message = False
+    for part in parts:
+        table = part.table
+        if part.leading_length and previous_in_message and rows:
+            owed[rows - 1] = owed.get(rows - 1, 0) + part.leading_length
+        remap = np.empty(len(table.authors), dtype=np.int16)
+        for i, author in enumerate(table.authors):
+            if author not in codes:
+                codes[author] = len(authors)
+                authors.append(author)
+            remap[i] = codes[author]
+        columns["day"].append(np.asarray(table.day))
+        columns["author"].append(remap[table.author] if len(table) else np.asarray(table.author))
+        columns["minute"].append(np.asarray(table.minute))
+        columns["length"].append(np.asarray(table.length))
+        rows += len(table)
+        if part.ends_in_message is not None:
+            previous_in_message = part.ends_in_message
+    dtypes = {"day": np.int32, "author": np.int16, "minute": np.int16, "length": np.uint16}
+    merged = {name: np.concatenate(arrays).astype(dtypes[name], copy=False) if arrays else np.empty(0, dtypes[name])
+              for name, arrays in columns.items()}
+    for row, extra in owed.items():
+        merged["length"][row] = min(int(merged["length"][row]) + extra, MAX_LENGTH)
+    return MessageTable(merged["day"], merged["author"], merged["minute"], merged["length"], authors)
+
+def load_message_table(filepath, date_format="%d/%m/%Y", workers=1):
+    """
+    Parses a chat file into a MessageTable, in parallel if workers != 1.
+    Returns None if the file could not be read.
+    """
+    print("\nLoading chat into message table...")
+    try:
+        table = parse_parallel(filepath, workers, date_format).table
+    except FileNotFoundError:
+        print(f"Error: The file '{filepath}' was not found.")
+        return None
+    except Exception as e:
+        print(f"An error occurred while reading the file: {e}")
+        return None
+    print(f"File processed. Loaded {len(table)} messages from {len(table.authors)} authors.")
+    return table
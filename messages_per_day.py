@@ -1,10 +1,21 @@
+from pathlib import Path
+import argparse
 import sys
-from helpers import *
-from data_extraction import *
-from plot import *
+from helpers import get_date_input
+from parse_cache import load_cached_table
 
 # --- Main Program Execution ---
 if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Interactive WhatsApp chat analyzer.")
+    parser.add_argument("--no-cache", action="store_true", help="Parse the export without reading or writing the parse cache")
+    parser.add_argument("--clear-cache", action="store_true", help="Delete the parse cache before running")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes for parsing (0: one per CPU, default: 1)")
+    parser.add_argument("--bucket", choices=["auto", "day", "week", "month"], default="auto", help="Time bucket for date charts (default: auto, from the range length)")
+    parser.add_argument("--top", type=int, default=10, help="Authors shown individually; the rest are grouped as 'Others' (default: 10)")
+    parser.add_argument("--output-dir", help="Write plots to this folder instead of opening a browser")
+    parser.add_argument("--format", choices=["html", "png", "svg"], default="html", help="File format with --output-dir (default: html)")
+    args = parser.parse_args()
     
     # 1. SET FILE PATH
     chat_file_path = 'WhatsApp Chat with 𝐎𝐣𝐨𝐮-𝐒𝐚𝐦𝐚✨.txt'
@@ -26,33 +37,51 @@ if __name__ == "__main__":
     print("  1. Messages per Day (Total)")
     print("  2. Messages per Person (Total)")
     print("  3. Messages per Person per Day (Grouped Chart)")
-    print("  4. All")
+    print("  4. Activity by Weekday and Hour (Heatmaps)")
+    print("  5. All")
     
     choice = ""
-    while choice not in ['1', '2', '3', '4']:
-        choice = input("Enter your choice (1-4): ")
+    while choice not in ['1', '2', '3', '4', '5']:
+        choice = input("Enter your choice (1-5): ")
 
     # 4. RUN CHOSEN ANALYSIS
-    
-    if choice == '1' or choice == '4':
-        daily_data = extract_messages_per_day(chat_file_path, start_date, end_date)
-        if daily_data:
-            plot_daily_graph(daily_data, start_date, end_date)
+    # The chat is parsed once into a columnar table; every analysis is a
+    # vectorized aggregate over it.
+    table = load_cached_table(chat_file_path, use_cache=not args.no_cache, clear=args.clear_cache, workers=args.workers or None)
+    if table is not None:
+        table = table.select(start_date, end_date)
+
+    # plotly is only loaded once there is something to plot
+    from plot import (plot_author_graph, plot_author_hour_heatmap, plot_daily_author_graph, plot_daily_graph,
+                      plot_hour_weekday_heatmap)
+
+    def output_for(name):
+        return Path(args.output_dir) / f"{name}.{args.format}" if args.output_dir else None
+
+    if choice == '1' or choice == '5':
+        if table is not None and len(table):
+            plot_daily_graph(table.daily_counts(), start_date, end_date, args.bucket, output_for("messages_per_day"))
         else:
             print("Could not generate daily plot (file error or no data).")
 
-    if choice == '2' or choice == '4':
-        author_data = extract_messages_per_person(chat_file_path, start_date, end_date)
-        if author_data:
-            plot_author_graph(author_data)
+    if choice == '2' or choice == '5':
+        if table is not None and len(table):
+            plot_author_graph(table.author_counts(), args.top, output_for("messages_per_person"))
         else:
             print("Could not generate author plot (file error or no data).")
 
-    if choice == '3' or choice == '4':
-        daily_author_data = extract_messages_per_person_per_day(chat_file_path, start_date, end_date)
-        if daily_author_data:
-            plot_daily_author_graph(daily_author_data, start_date, end_date)
+    if choice == '3' or choice == '5':
+        if table is not None and len(table):
+            plot_daily_author_graph(table.author_day_matrix(), start_date, end_date,
+                                    args.bucket, args.top, output_for("messages_per_person_per_day"))
         else:
             print("Could not generate daily author plot (file error or no data).")
 
+    if choice == '4' or choice == '5':
+        if table is not None and len(table):
+            plot_hour_weekday_heatmap(table.hour_weekday_matrix(), start_date, end_date, output_for("activity_by_weekday_hour"))
+            plot_author_hour_heatmap(table.author_hour_matrix(), args.top, output_for("activity_by_person_hour"))
+        else:
+            print("Could not generate activity heatmaps (file error or no data).")
+
     print("\nAnalysis complete.")
\ No newline at end of file
@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+from helpers import CACHE_SUFFIX, FINGERPRINT_BYTES, file_fingerprint, hash_range
+from message_table import MessageTable, TablePart, join_parts, parse_parallel, parse_range
+
+# --- Configuration ---
+CACHE_VERSION = 2
+COLUMNS = ("day", "author", "minute", "length")
+# ---------------------
+
+def cache_dir_for(filepath):
+    """The cache lives next to the export: 'chat.txt' -> 'chat.txt.cache/'."""
+    path = Path(filepath)
+    return path.with_name(path.name + CACHE_SUFFIX)
+
+def ingest_state(filepath, parsed_bytes, in_message):
+    """
+    Records how far the export was parsed, so a later export that only
+    appends to it can be ingested incrementally (see append_offset()).
+    parsed_bytes is None when the file doesn't end on a complete line.
+    """
+    if parsed_bytes is None:
+        return {"parsed_bytes": None}
+    with open(filepath, 'rb') as f:
+        return {
+            "parsed_bytes": parsed_bytes,
+            "head_hash": hash_range(f, 0, min(FINGERPRINT_BYTES, parsed_bytes)),
+            "tail_hash": hash_range(f, max(0, parsed_bytes - FINGERPRINT_BYTES), parsed_bytes),
+            "in_message": bool(in_message),
+        }
+
+def append_offset(filepath, meta, fingerprint):
+    """
+    Returns the byte offset to resume parsing from if the export is the
+    previously ingested one with new lines appended, otherwise None.
+    """
+    state = meta.get("ingest", {})
+    parsed_bytes = state.get("parsed_bytes")
+    if parsed_bytes is None or meta["fingerprint"]["path"] != fingerprint["path"]:
+        return None
+    if fingerprint["size"] < parsed_bytes:
+        return None
+    with open(filepath, 'rb') as f:
+        if hash_range(f, max(0, parsed_bytes - FINGERPRINT_BYTES), parsed_bytes) != state["tail_hash"]:
+            return None
+        if hash_range(f, 0, min(FINGERPRINT_BYTES, parsed_bytes)) != state["head_hash"]:
+            return None
+    return parsed_bytes
+
+def read_meta(filepath):
+    try:
+        with open(cache_dir_for(filepath) / "meta.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return meta if meta.get("version") == CACHE_VERSION else None
+
+def read_table(filepath, meta):
+    """Maps the cached columns into memory. Returns None if they are missing or corrupt."""
+    cache_dir = cache_dir_for(filepath)
+    try:
+        columns = [np.load(cache_dir / f"{name}.npy", mmap_mode='r') for name in COLUMNS]
+    except (FileNotFoundError, ValueError):
+        return None
+    return MessageTable(*columns, meta["authors"])
+
+def read_cache(filepath, fingerprint=None):
+    """
+    Maps a valid cached MessageTable into memory.
+    Returns None if there is no cache or it belongs to another version of the file.
+    """
+    meta = read_meta(filepath)
+    if meta is None or meta.get("fingerprint") != (fingerprint or file_fingerprint(filepath)):
+        return None
+    return read_table(filepath, meta)
+
+def write_cache(filepath, table, fingerprint=None, ingest=None):
+    """Saves a MessageTable next to the export, replacing any older cache."""
+    cache_dir = cache_dir_for(filepath)
+    tmp_dir = cache_dir.with_name(f"{cache_dir.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+    for name in COLUMNS:
+        np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(getattr(table, name)))
+    meta = {
+        "version": CACHE_VERSION,
+        "fingerprint": fingerprint or file_fingerprint(filepath),
+        "authors": table.authors,
+        "ingest": ingest or {"parsed_bytes": None},
+    }
+    with open(tmp_dir / "meta.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    clear_cache(filepath)
+    os.replace(tmp_dir, cache_dir)
+
+def clear_cache(filepath):
+    shutil.rmtree(cache_dir_for(filepath), ignore_errors=True)
+
+def parse_export(filepath, fingerprint, meta=None, workers=1):
+    """
+    Parses the export into a MessageTable. If the cached version is a prefix
+    of the file, only the appended bytes are parsed and joined onto it.
+    A full parse uses `workers` processes (see message_table.parse_parallel).
+    Returns (table, ingest_state).
+    """
+    offset = append_offset(filepath, meta, fingerprint) if meta else None
+    base = read_table(filepath, meta) if offset is not None else None
+
+    if base is not None:
+        print(f"\nExport grew by {fingerprint['size'] - offset} bytes, parsing only the new lines...")
+        new_part = parse_range(filepath, start=offset)
+        in_message = meta["ingest"]["in_message"]
+        table = join_parts([TablePart(base, ends_in_message=in_message), new_part])
+        if new_part.ends_in_message is not None:
+            in_message = new_part.ends_in_message
+        end_offset = new_part.end_offset
+    else:
+        print("\nLoading chat into message table...")
+        part = parse_parallel(filepath, workers)
+        table, in_message, end_offset = part.table, part.ends_in_message, part.end_offset
+
+    with open(filepath, 'rb') as f:
+        f.seek(max(0, end_offset - 1))
+        complete = f.read(1) in (b"\n", b"")
+    state = ingest_state(filepath, end_offset if complete else None, in_message)
+    print(f"File processed. Loaded {len(table)} messages from {len(table.authors)} authors.")
+    return table, state
+
+def load_cached_table(filepath, use_cache=True, clear=False, workers=1):
+    """
+    Returns the chat's MessageTable, from the sidecar cache when it matches
+    the file, otherwise by parsing it (and refreshing the cache). An export
+    that only grew at the end is parsed incrementally.
+    Returns None if the file could not be read.
+    """
+    if clear:
+        clear_cache(filepath)
+
+    try:
+        fingerprint = file_fingerprint(filepath)
+        meta = read_meta(filepath) if use_cache else None
+        if meta is not None and meta["fingerprint"] == fingerprint:
+            table = read_table(filepath, meta)
+            if table is not None:
+                print(f"\nLoaded {len(table)} messages from cache '{cache_dir_for(filepath)}'.")
+                return table
+        table, state = parse_export(filepath, fingerprint, meta, workers)
+    except FileNotFoundError:
+        print(f"Error: The file '{filepath}' was not found.")
+        return None
+    except Exception as e:
+        print(f"An error occurred while reading the file: {e}")
+        return None
+
+    if use_cache:
+        try:
+            write_cache(filepath, table, fingerprint, state)
+        except OSError as e:
+            print(f"Warning: Could not write parse cache: {e}")
+    return table
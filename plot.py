@@ -1,42 +1,180 @@
+from pathlib import Path
+import numpy as np
 import plotly.graph_objects as go
+import instrumentation
 
-# --- (Plot 1) Plot Daily Graph ---
-def plot_daily_graph(message_counts, start_date=None, end_date=None):
-    if not message_counts:
-        print("No daily message data found to plot.")
-        return
-    print("Generating interactive 'Messages per Day' plot...")
-    
+# Each plot accepts either the dicts returned by data_extraction or the
+# arrays returned by MessageTable (see message_table.py):
+#   plot_daily_graph:        {date: count} or (dates, counts)
+#   plot_author_graph:       {author: count} or (authors, counts)
+#   plot_daily_author_graph: {date: {author: count}} or (dates, authors, matrix)
+#   plot_hour_weekday_heatmap: {weekday: [24 counts]} or (weekdays, matrix)
+#   plot_author_hour_heatmap:  {author: [24 counts]} or (authors, matrix)
+#
+# Long chats are bucketed by week or month and only the top authors get
+# their own trace, so the number of bars stays bounded. With output=<path>
+# a plot is written to .html (plotly.js is shared as plotly.min.js next to
+# it), .png or .svg (needs kaleido) instead of opening a browser.
+
+# --- Configuration ---
+MAX_BARS = 400       # Bars per trace before "auto" switches to a coarser bucket
+TOP_AUTHORS = 10     # Authors with their own trace; the rest are summed into "Others"
+OTHERS_LABEL = "Others"
+# ---------------------
+
+BUCKETS = ["day", "week", "month"]
+_BUCKET_TITLES = {"day": "Daily", "week": "Weekly", "month": "Monthly"}
+_BUCKET_AXES = {"day": "Date", "week": "Week starting", "month": "Month"}
+
+def _is_empty(data):
+    if isinstance(data, tuple):
+        return len(data[0]) == 0
+    return not data
+
+# --- Down-sampling ---
+def choose_bucket(dates, max_bars=MAX_BARS):
+    """The finest bucket that keeps the date span within max_bars bars."""
+    span = int((dates.max() - dates.min()).astype(np.int64)) + 1
+    if span <= max_bars:
+        return "day"
+    if span // 7 + 1 <= max_bars:
+        return "week"
+    return "month"
+
+def bucket_dates(dates, bucket):
+    """Maps datetime64[D] dates to the first day of their week (Monday) or month."""
+    if bucket == "week":
+        days = dates.astype(np.int64)
+        return (days - (days + 3) % 7).astype("datetime64[D]") # 1970-01-01 was a Thursday
+    if bucket == "month":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    return dates
+
+def bucket_counts(dates, counts, bucket):
+    """
+    Sums counts (shape (n,) or (rows, n)) over each bucket.
+    Returns (bucket_dates, summed_counts).
+    """
+    keys, inverse = np.unique(bucket_dates(dates, bucket), return_inverse=True)
+    counts = np.asarray(counts)
+    if counts.ndim == 1:
+        return keys, np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+    summed = np.zeros((counts.shape[0], len(keys)), dtype=np.int64)
+    np.add.at(summed, (slice(None), inverse), counts)
+    return keys, summed
+
+def top_authors(authors, matrix, top_n=TOP_AUTHORS):
+    """Keeps the top_n authors by total messages and sums the rest into one 'Others' row."""
+    if top_n is None or len(authors) <= top_n:
+        return list(authors), matrix
+    order = np.argsort(-matrix.sum(axis=1), kind="stable")
+    keep, rest = order[:top_n], order[top_n:]
+    authors = [authors[i] for i in keep] + [OTHERS_LABEL]
+    return authors, np.vstack([matrix[keep], matrix[rest].sum(axis=0)])
+
+def _daily_arrays(message_counts):
+    if isinstance(message_counts, tuple):
+        dates, counts = message_counts
+        return np.asarray(dates, dtype="datetime64[D]"), np.asarray(counts)
     sorted_items = sorted(message_counts.items())
     dates, counts = zip(*sorted_items)
-    
-    fig = go.Figure(data=[go.Bar(x=dates, y=counts)])
-    
-    title_text = "Daily WhatsApp Message Count (User Messages Only)"
+    return np.array(dates, dtype="datetime64[D]"), np.array(counts)
+
+def _author_day_arrays(daily_author_counts):
+    if isinstance(daily_author_counts, tuple):
+        # Dense arrays from MessageTable.author_day_matrix(): one row per author
+        dates, authors, matrix = daily_author_counts
+        return np.asarray(dates, dtype="datetime64[D]"), list(authors), np.asarray(matrix)
+    all_dates = sorted(daily_author_counts.keys())
+    all_authors = sorted({author for date_counts in daily_author_counts.values() for author in date_counts})
+    # Get count for each author on each day, default to 0
+    matrix = np.array([[daily_author_counts[date].get(author, 0) for date in all_dates] for author in all_authors])
+    return np.array(all_dates, dtype="datetime64[D]"), all_authors, matrix
+
+def _hour_rows(hour_counts):
+    """(row labels, rows x 24 matrix) from {label: [24 counts]} or a (labels, matrix) tuple."""
+    if isinstance(hour_counts, tuple):
+        labels, matrix = hour_counts
+        return list(labels), np.asarray(matrix).reshape(len(labels), 24)
+    return list(hour_counts), np.array(list(hour_counts.values()), dtype=np.int64).reshape(len(hour_counts), 24)
+
+def _resolve_bucket(dates, bucket):
+    return choose_bucket(dates) if bucket == "auto" else bucket
+
+def _date_title(title_text, start_date, end_date):
     if start_date and end_date:
         title_text += f"<br>From {start_date.strftime('%d-%b-%Y')} to {end_date.strftime('%d-%b-%Y')}"
     elif start_date:
         title_text += f"<br>From {start_date.strftime('%d-%b-%Y')} onwards"
     elif end_date:
         title_text += f"<br>Up to {end_date.strftime('%d-%b-%Y')}"
-    
+    return title_text
+
+# --- Output ---
+def render(fig, output=None):
+    """
+    Shows the figure in the browser, or writes it to output: '.html' with
+    plotly.js shared in the same folder, '.png' or '.svg' (needs kaleido).
+    """
+    with instrumentation.stage("plot.render") as stage:
+        stage.add(traces=len(fig.data), points=sum(np.size(trace.z if trace.type == "heatmap" else trace.x)
+                                                   for trace in fig.data if trace.x is not None))
+        if output is None:
+            fig.show(renderer="browser")
+            return
+        output = Path(output)
+        suffix = output.suffix.lower()
+        try:
+            output.parent.mkdir(parents=True, exist_ok=True)
+            if suffix in (".html", ".htm"):
+                fig.write_html(output, include_plotlyjs="directory", full_html=True)
+            elif suffix in (".png", ".svg"):
+                fig.write_image(output)
+            else:
+                print(f"Error: Unsupported plot format '{suffix}' (use .html, .png or .svg).")
+                return
+        except (ImportError, ValueError, RuntimeError, OSError) as e:
+            print(f"Error: Could not write '{output}': {e}")
+            return
+    print(f"Plot written to '{output}'.")
+
+# --- (Plot 1) Plot Daily Graph ---
+def plot_daily_graph(message_counts, start_date=None, end_date=None, bucket="auto", output=None):
+    if _is_empty(message_counts):
+        print("No daily message data found to plot.")
+        return
+    print("Generating interactive 'Messages per Day' plot...")
+
+    with instrumentation.stage("plot.prepare"):
+        dates, counts = _daily_arrays(message_counts)
+        bucket = _resolve_bucket(dates, bucket)
+        if bucket != "day":
+            dates, counts = bucket_counts(dates, counts, bucket)
+
+    fig = go.Figure(data=[go.Bar(x=dates, y=counts)])
+
+    title_text = _date_title(f"{_BUCKET_TITLES[bucket]} WhatsApp Message Count (User Messages Only)", start_date, end_date)
     fig.update_layout(
         title=title_text,
-        xaxis_title="Date",
+        xaxis_title=_BUCKET_AXES[bucket],
         yaxis_title="Number of Messages",
-        xaxis_rangeslider_visible=True, 
+        xaxis_rangeslider_visible=True,
         hovermode="x unified"
     )
-    fig.show(renderer="browser")
+    render(fig, output)
 
 # --- (Plot 2) Plot Author Graph ---
-def plot_author_graph(author_counts):
-    if not author_counts:
+def plot_author_graph(author_counts, top_n=None, output=None):
+    if _is_empty(author_counts):
         print("No author data found to plot.")
         return
     print("Generating interactive 'Messages per Person' plot...")
 
-    sorted_authors = sorted(author_counts.items(), key=lambda item: item[1], reverse=True)
+    items = zip(*author_counts) if isinstance(author_counts, tuple) else author_counts.items()
+    sorted_authors = sorted(items, key=lambda item: item[1], reverse=True)
+    if top_n is not None and len(sorted_authors) > top_n:
+        others = sum(count for _, count in sorted_authors[top_n:])
+        sorted_authors = sorted_authors[:top_n] + [(OTHERS_LABEL, others)]
     authors, counts = zip(*sorted_authors)
 
     fig = go.Figure(data=[go.Bar(x=authors, y=counts, text=counts, textposition='outside')])
@@ -46,37 +184,31 @@ def plot_author_graph(author_counts):
         yaxis_title="Number of Messages",
         hovermode="x unified"
     )
-    fig.show(renderer="browser")
+    render(fig, output)
 
 # --- (Plot 3) Plot Daily Author Graph ---
-def plot_daily_author_graph(daily_author_counts, start_date=None, end_date=None):
+def plot_daily_author_graph(daily_author_counts, start_date=None, end_date=None,
+                            bucket="auto", top_n=TOP_AUTHORS, output=None):
     """
-    Plots a grouped bar chart of messages per person, per day.
+    Plots a grouped bar chart of messages per person, per day (or per
+    week / month for long ranges), with at most top_n author traces.
     """
-    if not daily_author_counts:
+    if _is_empty(daily_author_counts):
         print("No daily author data found to plot.")
         return
     print("Generating interactive 'Messages per Person per Day' plot...")
 
-    # 1. Get all unique, sorted dates
-    all_dates = sorted(daily_author_counts.keys())
-    
-    # 2. Get all unique authors
-    all_authors = set()
-    for date_counts in daily_author_counts.values():
-        all_authors.update(date_counts.keys())
-    all_authors = sorted(list(all_authors))
-
-    # 3. Create one bar trace for each author
+    with instrumentation.stage("plot.prepare"):
+        all_dates, all_authors, matrix = _author_day_arrays(daily_author_counts)
+        bucket = _resolve_bucket(all_dates, bucket)
+        if bucket != "day":
+            all_dates, matrix = bucket_counts(all_dates, matrix, bucket)
+        all_authors, matrix = top_authors(all_authors, matrix, top_n)
+
+    # Create one bar trace for each author
     fig = go.Figure()
-    
-    for author in all_authors:
-        counts_for_this_author = []
-        for date in all_dates:
-            # Get count for this author on this day, default to 0
-            count = daily_author_counts[date].get(author, 0)
-            counts_for_this_author.append(count)
-        
+
+    for author, counts_for_this_author in zip(all_authors, matrix):
         fig.add_trace(go.Bar(
             x=all_dates,
             y=counts_for_this_author,
@@ -84,23 +216,57 @@ def plot_daily_author_graph(daily_author_counts, start_date=None, end_date=None)
         ))
 
     # --- Customize Layout ---
-    title_text = "Daily Messages per Person"
-    if start_date and end_date:
-        title_text += f"<br>From {start_date.strftime('%d-%b-%Y')} to {end_date.strftime('%d-%b-%Y')}"
-    elif start_date:
-        title_text += f"<br>From {start_date.strftime('%d-%b-%Y')} onwards"
-    elif end_date:
-        title_text += f"<br>Up to {end_date.strftime('%d-%b-%Y')}"
-    
+    title_text = _date_title(f"{_BUCKET_TITLES[bucket]} Messages per Person", start_date, end_date)
     fig.update_layout(
         title=title_text,
-        xaxis_title="Date",
+        xaxis_title=_BUCKET_AXES[bucket],
         yaxis_title="Number of Messages",
         barmode='group',  # This is the key: creates grouped bars
         xaxis_rangeslider_visible=True,
         hovermode="x unified" # Shows all authors for the hovered date
     )
-    
-    print("Displaying plot in your web browser...")
-    fig.show(renderer="browser")
 
+    if output is None:
+        print("Displaying plot in your web browser...")
+    render(fig, output)
+
+# --- (Plot 4) Plot Activity Heatmaps ---
+def _hour_heatmap(labels, matrix, title_text, yaxis_title, output):
+    hours = [f"{hour:02d}:00" for hour in range(24)]
+    fig = go.Figure(data=[go.Heatmap(
+        z=matrix,
+        x=hours,
+        y=labels,
+        colorscale="Viridis",
+        hovertemplate="%{y}, %{x}: %{z} messages<extra></extra>"
+    )])
+    fig.update_layout(
+        title=title_text,
+        xaxis_title="Hour of Day",
+        yaxis_title=yaxis_title
+    )
+    # Keep the row order of the data (top to bottom), and names like "+91 ..." as text
+    fig.update_yaxes(type="category", autorange="reversed")
+    render(fig, output)
+
+def plot_hour_weekday_heatmap(hour_weekday, start_date=None, end_date=None, output=None):
+    """Plots messages per weekday (rows, Monday first) and hour of day (columns)."""
+    weekdays, matrix = _hour_rows(hour_weekday)
+    if not matrix.any():
+        print("No timed message data found to plot.")
+        return
+    print("Generating interactive 'Activity by Weekday and Hour' heatmap...")
+    title_text = _date_title("Messages by Weekday and Hour of Day", start_date, end_date)
+    _hour_heatmap(weekdays, matrix, title_text, "Weekday", output)
+
+def plot_author_hour_heatmap(author_hour, top_n=TOP_AUTHORS, output=None):
+    """Plots messages per person (rows, most active first) and hour of day (columns)."""
+    authors, matrix = _hour_rows(author_hour)
+    if not matrix.any():
+        print("No timed author data found to plot.")
+        return
+    print("Generating interactive 'Activity by Person and Hour' heatmap...")
+    with instrumentation.stage("plot.prepare"):
+        order = np.argsort(-matrix.sum(axis=1), kind="stable")
+        authors, matrix = top_authors([authors[i] for i in order], matrix[order], top_n)
+    _hour_heatmap(authors, matrix, "Messages by Person and Hour of Day", "Author", output)
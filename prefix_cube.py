@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+from collections import defaultdict
+import numpy as np
+from helpers import CUBE_SUFFIX, file_fingerprint, sidecar_path
+from message_table import datetime64_to_dates, ordinals_to_datetime64
+
+# --- Configuration ---
+CUBE_VERSION = 1
+# ---------------------
+
+class PrefixCube:
+    """
+    Cumulative message counts over a contiguous run of days, so any date
+    window is answered from two row lookups instead of a scan.
+
+    by_author[d, a] = messages by author a on days before first_day + d
+    by_hour[d, h]   = messages in hour h on days before first_day + d (optional)
+    """
+
+    def __init__(self, first_day, authors, by_author, by_hour=None):
+        self.first_day = first_day
+        self.authors = authors
+        self.by_author = by_author
+        self.by_hour = by_hour
+
+    @property
+    def days(self):
+        return len(self.by_author) - 1
+
+    @classmethod
+    def from_table(cls, table, with_hours=True):
+        """Builds the cube from a MessageTable with one bincount per dimension."""
+        if not len(table):
+            return cls(0, list(table.authors), np.zeros((1, len(table.authors)), dtype=np.int64),
+                       np.zeros((1, 24), dtype=np.int64) if with_hours else None)
+        first_day = int(table.day.min())
+        days = int(table.day.max()) - first_day + 1
+
+        def cumulative(day, columns, width):
+            counts = np.bincount(day * width + columns, minlength=days * width).reshape(days, width)
+            cube = np.zeros((days + 1, width), dtype=np.int64)
+            np.cumsum(counts, axis=0, out=cube[1:])
+            return cube
+
+        day = (table.day - first_day).astype(np.intp)
+        by_author = cumulative(day, table.author.astype(np.intp), len(table.authors))
+        by_hour = None
+        if with_hours:
+            timed = table.minute >= 0
+            by_hour = cumulative(day[timed], (table.minute[timed] // 60).astype(np.intp), 24)
+        return cls(first_day, list(table.authors), by_author, by_hour)
+
+    def _rows(self, start_date=None, end_date=None):
+        """Maps an inclusive date window to cube rows [first, last)."""
+        first = start_date.toordinal() - self.first_day if start_date else 0
+        last = end_date.toordinal() - self.first_day + 1 if end_date else self.days
+        first = min(max(first, 0), self.days)
+        last = min(max(last, first), self.days)
+        return first, last
+
+    # --- Queries ---
+    def author_totals(self, start_date=None, end_date=None):
+        """Returns (authors, counts) for authors with messages in the window."""
+        first, last = self._rows(start_date, end_date)
+        counts = self.by_author[last] - self.by_author[first]
+        present = np.flatnonzero(counts)
+        return [self.authors[i] for i in present], counts[present]
+
+    def hour_totals(self, start_date=None, end_date=None):
+        """Returns 24 message counts, one per hour of the day, for the window."""
+        if self.by_hour is None:
+            raise ValueError("This cube was built without the hour dimension.")
+        first, last = self._rows(start_date, end_date)
+        return self.by_hour[last] - self.by_hour[first]
+
+    def daily_totals(self, start_date=None, end_date=None):
+        """Returns (dates, counts) for days with messages in the window."""
+        first, last = self._rows(start_date, end_date)
+        totals = np.diff(self.by_author[first:last + 1].sum(axis=1))
+        present = np.flatnonzero(totals)
+        return ordinals_to_datetime64(present + first + self.first_day), totals[present]
+
+    def author_day_matrix(self, start_date=None, end_date=None):
+        """Returns (dates, authors, matrix) like MessageTable.author_day_matrix, for the window."""
+        first, last = self._rows(start_date, end_date)
+        per_day = np.diff(self.by_author[first:last + 1], axis=0)
+        days = np.flatnonzero(per_day.sum(axis=1))
+        authors = np.flatnonzero(per_day.sum(axis=0))
+        matrix = per_day[np.ix_(days, authors)].T
+        return ordinals_to_datetime64(days + first + self.first_day), [self.authors[i] for i in authors], matrix
+
+    # --- Dict views (same shape as data_extraction's results) ---
+    def results(self, aggregate_names, start_date=None, end_date=None):
+        """Answers data_extraction aggregates ("daily", "authors", "author_daily") from the cube."""
+        results = {}
+        for name in aggregate_names:
+            if name == "daily":
+                dates, counts = self.daily_totals(start_date, end_date)
+                results[name] = defaultdict(int, zip(datetime64_to_dates(dates), counts.tolist()))
+            elif name == "authors":
+                authors, counts = self.author_totals(start_date, end_date)
+                results[name] = defaultdict(int, zip(authors, counts.tolist()))
+            elif name == "author_daily":
+                dates, authors, matrix = self.author_day_matrix(start_date, end_date)
+                result = defaultdict(lambda: defaultdict(int))
+                for date_obj, column in zip(datetime64_to_dates(dates), matrix.T.tolist()):
+                    result[date_obj] = defaultdict(int, ((a, c) for a, c in zip(authors, column) if c))
+                results[name] = result
+            else:
+                raise KeyError(name)
+        return results
+
+SUPPORTED_AGGREGATES = {"daily", "authors", "author_daily"}
+
+def cube_path_for(filepath):
+    """The cube lives next to the export: 'chat.txt' -> 'chat.txt.cube.npz'."""
+    return sidecar_path(filepath, CUBE_SUFFIX)
+
+def save_prefix_cube(filepath, cube, fingerprint=None):
+    meta = {
+        "version": CUBE_VERSION,
+        "fingerprint": fingerprint or file_fingerprint(filepath),
+        "first_day": cube.first_day,
+        "authors": cube.authors,
+    }
+    arrays = {"by_author": cube.by_author, "meta": np.array(json.dumps(meta, ensure_ascii=False))}
+    if cube.by_hour is not None:
+        arrays["by_hour"] = cube.by_hour
+    path = cube_path_for(filepath)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_prefix_cube(filepath, fingerprint=None):
+    """Returns the saved PrefixCube if it was built for this version of the file, else None."""
+    try:
+        with np.load(cube_path_for(filepath)) as saved:
+            meta = json.loads(str(saved["meta"]))
+            if meta.get("version") != CUBE_VERSION:
+                return None
+            if meta.get("fingerprint") != (fingerprint or file_fingerprint(filepath)):
+                return None
+            by_hour = saved["by_hour"] if "by_hour" in saved.files else None
+            return PrefixCube(meta["first_day"], meta["authors"], saved["by_author"], by_hour)
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return None
+
+def ensure_prefix_cube(filepath, with_hours=True, workers=1):
+    """
+    Returns the chat's PrefixCube, building and saving it (from the cached
+    MessageTable) if there is no valid one yet. Returns None if the file
+    could not be read.
+    """
+    try:
+        fingerprint = file_fingerprint(filepath)
+    except FileNotFoundError:
+        print(f"Error: The file '{filepath}' was not found.")
+        return None
+    cube = load_prefix_cube(filepath, fingerprint)
+    if cube is not None and (cube.by_hour is not None or not with_hours):
+        return cube
+
+    from parse_cache import load_cached_table
+    table = load_cached_table(filepath, workers=workers)
+    if table is None:
+        return None
+    cube = PrefixCube.from_table(table, with_hours)
+    try:
+        save_prefix_cube(filepath, cube, fingerprint)
+    except OSError as e:
+        print(f"Warning: Could not write prefix cube: {e}")
+    return cube
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the prefix-sum cube for a chat export.")
+    parser.add_argument("file", help="Chat export (.txt)")
+    parser.add_argument("--no-hours", action="store_true", help="Skip the day x hour dimension")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes for parsing (0: one per CPU, default: 1)")
+    args = parser.parse_args(argv)
+
+    cube = ensure_prefix_cube(args.file, with_hours=not args.no_hours, workers=args.workers or None)
+    if cube is not None:
+        print(f"Prefix cube ready: {cube.days} days x {len(cube.authors)} authors ({cube_path_for(args.file)}).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import mmap
+from contextlib import contextmanager
+from helpers import DATE_CACHE_SIZE, parse_date_cached, parse_time_str
+
+BLOCK_SIZE = 8 * 1024 * 1024 # Bytes copied out of the mapping and split at a time
+MAX_DATE_BYTES = 64
+
+# UTF-8 continuation bytes; deleting them from a byte string leaves one byte per character.
+_UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+
+@contextmanager
+def open_mmap(filepath):
+    """Maps a file read-only. Empty files yield b'' (they can't be mapped)."""
+    with open(filepath, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b""
+            return
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+def char_count(data, _deleted=_UTF8_CONTINUATION):
+    """Number of characters in UTF-8 bytes, without decoding them."""
+    return len(data.translate(None, _deleted))
+
+class LineScanner:
+    """
+    Scans raw export bytes line by line, finding the date, the " - "
+    separator and the author colon with bytes.find. Only the author span is
+    decoded (once per distinct author); dates and times are looked up per
+    distinct byte string. Message text stays as bytes until a caller
+    decodes it.
+
+    Lines are split on b"\\n" only, so a lone "\\r" is not a line break.
+    """
+
+    def __init__(self, date_format="%d/%m/%Y"):
+        self.date_format = date_format
+        self._dates = {}
+        self._times = {}
+        self._authors = {}
+
+    def _date(self, date_bytes):
+        date_obj = self._dates.get(date_bytes, False)
+        if date_obj is False:
+            try:
+                date_obj = parse_date_cached(date_bytes.decode('utf-8'), self.date_format)
+            except UnicodeDecodeError:
+                date_obj = None
+            if len(self._dates) >= DATE_CACHE_SIZE:
+                self._dates.clear() # Continuation lines with early commas would grow it forever
+            self._dates[date_bytes] = date_obj
+        return date_obj
+
+    def _time(self, time_bytes):
+        minute = self._times.get(time_bytes, False)
+        if minute is False:
+            minute = self._times[time_bytes] = parse_time_str(time_bytes.decode('utf-8', 'replace'))
+        return minute
+
+    def _author(self, author_bytes):
+        author = self._authors.get(author_bytes)
+        if author is None:
+            author = self._authors[author_bytes] = author_bytes.decode('utf-8').strip()
+        return author
+
+    def scan(self, buf, start=0, end=None, with_time=True, day_starts=None):
+        """
+        Yields one tuple per line of buf[start:end]:
+            (date_obj, minute, author, line, body_start)
+        where line is the raw bytes of the line without its line ending and
+        line[body_start:] is the message body.
+        - user message:  all fields set; body is the text after the author colon
+        - system line:   author is None (e.g. "User left")
+        - continuation:  date_obj is None; body is the whole line
+        minute is None when with_time is False or the time can't be read.
+        If day_starts is a list, (date ordinal, byte offset) is appended to it
+        for every dated line whose date differs from the dated line before it
+        (see date_index.py).
+        """
+        end = len(buf) if end is None else end
+        dates, times, authors = self._dates, self._times, self._authors
+        date_of, time_of, author_of = self._date, self._time, self._author
+        position = start
+        last_date = None
+        while position < end:
+            # Work through the mapping in blocks cut at a newline, so splitting
+            # into lines happens in C and memory stays bounded.
+            block_end = min(end, position + BLOCK_SIZE)
+            if block_end < end:
+                newline = buf.rfind(b"\n", position, block_end)
+                if newline == -1:
+                    newline = buf.find(b"\n", block_end, end)
+                block_end = end if newline == -1 else newline + 1
+            lines = buf[position:block_end].split(b"\n")
+            if not lines[-1]:
+                lines.pop() # Block ended with a newline
+            offset = position
+            position = block_end
+
+            for line in lines:
+                line_start = offset
+                offset += len(line) + 1
+                if line.endswith(b"\r"):
+                    line = line.rstrip(b"\r\n")
+
+                # A dated line always has "date, time - ..."; without a comma it's a continuation
+                comma = line.find(b",", 0, MAX_DATE_BYTES + 1)
+                if comma == -1:
+                    yield None, None, None, line, 0
+                    continue
+                date_bytes = line[:comma]
+                date_obj = dates.get(date_bytes, False)
+                if date_obj is False:
+                    date_obj = date_of(date_bytes)
+                if date_obj is None:
+                    yield None, None, None, line, 0
+                    continue
+                if date_obj is not last_date and day_starts is not None and date_obj != last_date:
+                    day_starts.append((date_obj.toordinal(), line_start))
+                last_date = date_obj
+
+                hyphen = line.find(b" - ")
+                colon = line.find(b":", hyphen + 3) if hyphen != -1 else -1
+                if colon == -1:
+                    yield date_obj, None, None, line, 0
+                    continue
+                author_bytes = line[hyphen + 3:colon]
+                author = authors.get(author_bytes)
+                if author is None:
+                    author = author_of(author_bytes)
+                if not author:
+                    yield date_obj, None, None, line, 0
+                    continue
+
+                minute = None
+                if with_time:
+                    time_bytes = line[comma + 1:hyphen]
+                    minute = times.get(time_bytes, False)
+                    if minute is False:
+                        minute = time_of(time_bytes)
+                yield date_obj, minute, author, line, colon + 1
@@ -0,0 +1,211 @@
+"""
+Fixed-memory, mergeable summaries for streaming analytics: they see every
+value once, never store the values themselves, and partial sketches (one
+per worker, chat or period) can be merged into one.
+
+DDSketch: quantiles of positive values (e.g. reply times) with a relative
+error guarantee: every reported quantile is within RELATIVE_ACCURACY of a
+value at that rank. Values are counted in logarithmic buckets, so a range
+from one second to a year needs about 1000 buckets at 1%, however many
+values are added. See Masson, Rim and Lee, "DDSketch: A Fast and Fully-
+Mergeable Quantile Sketch with Relative-Error Guarantees" (VLDB 2019).
+
+SpaceSaving: the most frequent items of a stream (e.g. words) with at most
+about 2 * capacity counters. Every reported count is an upper bound, off by
+at most its reported error; an item missing from the sketch occurred at
+most `floor` times. See Metwally, Agrawal and El Abbadi, "Efficient
+Computation of Frequent and Top-k Elements in Data Streams" (ICDT 2005),
+and Agarwal et al., "Mergeable Summaries" (PODS 2012) for merging.
+"""
+from operator import itemgetter
+import math
+
+# --- Configuration ---
+RELATIVE_ACCURACY = 0.01 # DDSketch quantiles are within 1% of a true value
+MAX_BUCKETS = 2048       # DDSketch buckets kept before the lowest ones are collapsed
+SPACE_SAVING_CAPACITY = 1000 # SpaceSaving counters kept after each pruning
+# ---------------------
+
+class DDSketch:
+    """
+    Quantile sketch for values >= 0. Bucket i counts the values in
+    (gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), and reports them
+    as 2 * gamma^i / (gamma + 1), which is within a relative error a of all
+    of them. Zero (and anything below min_value) has its own bucket, since
+    logarithms can't reach it. If more than max_buckets are in use the
+    lowest ones are merged, so only the smallest quantiles lose accuracy.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, max_buckets=MAX_BUCKETS, min_value=1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.buckets = {} # bucket index -> count
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, count=1):
+        if value < 0:
+            raise ValueError(f"DDSketch only holds values >= 0, got {value}")
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= self.min_value:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + count
+        if len(buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        """Folds the lowest buckets into one until max_buckets are left."""
+        indexes = sorted(self.buckets)
+        excess = len(indexes) - self.max_buckets
+        target = indexes[excess]
+        self.buckets[target] += sum(self.buckets.pop(index) for index in indexes[:excess])
+
+    def merge(self, other):
+        """Adds another sketch's values to this one (both need the same relative accuracy)."""
+        if other.gamma != self.gamma:
+            raise ValueError("Can't merge DDSketches with different relative accuracies")
+        if not other.count:
+            return
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q):
+        """The value at quantile q (0..1), or None if the sketch is empty."""
+        if not self.count:
+            return None
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(self.min, 0.0)
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max) # The true extremes are known exactly
+        return self.max
+
+    def quantiles(self, qs):
+        return [self.quantile(q) for q in qs]
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def __len__(self):
+        return self.count
+
+class SpaceSaving:
+    """
+    Heavy-hitters sketch. Counts items exactly until 2 * capacity are
+    tracked, then keeps the capacity largest counts and raises `floor` to
+    the largest count it dropped. An item that isn't tracked starts at
+    floor (it may have been dropped with that many), and remembers floor
+    as its error. Pruning in batches rather than evicting one counter per
+    new item keeps add() a dict update. Sketches with floor == 0 are exact.
+    """
+
+    def __init__(self, capacity=SPACE_SAVING_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.counts = {} # item -> estimated count (never below the true count)
+        self.errors = {} # item -> overestimate bound, for items added after a pruning
+        self.floor = 0
+        self.total = 0
+
+    def add(self, item, count=1):
+        self.total += count
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+            return
+        counts[item] = self.floor + count
+        if self.floor:
+            self.errors[item] = self.floor
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+
+    def update(self, item_counts):
+        """Adds a {item: count} mapping (e.g. a Counter of one batch of messages)."""
+        counts, errors, floor = self.counts, self.errors, self.floor
+        for item, count in item_counts.items():
+            if item in counts:
+                counts[item] += count
+            else:
+                counts[item] = floor + count
+                if floor:
+                    errors[item] = floor
+        self.total += sum(item_counts.values())
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self, size=None):
+        """Keeps the `size` (default: capacity) largest counts; ties go to the smaller item, so results don't depend on order."""
+        size = self.capacity if size is None else size
+        if len(self.counts) <= size:
+            return
+        ranked = sorted(self.counts.items(), key=itemgetter(0))
+        ranked.sort(key=itemgetter(1), reverse=True)
+        self.floor = max(self.floor, ranked[size][1])
+        self.counts = dict(ranked[:size])
+        self.errors = {item: self.errors[item] for item in self.counts if item in self.errors}
+
+    def merge(self, other):
+        """
+        Adds another sketch's items to this one. An item tracked by only one
+        side may have been dropped by the other, so it gets the other's
+        floor added to both its count and its error.
+        """
+        counts, errors = self.counts, self.errors
+        for item in counts.keys() - other.counts.keys():
+            if other.floor:
+                counts[item] += other.floor
+                errors[item] = errors.get(item, 0) + other.floor
+        for item, count in other.counts.items():
+            error = other.errors.get(item, 0)
+            if item in counts:
+                counts[item] += count
+            else:
+                counts[item] = self.floor + count
+                error += self.floor
+            if error:
+                errors[item] = errors.get(item, 0) + error
+        self.floor += other.floor
+        self.total += other.total
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+
+    def top(self, k=None):
+        """The k (default: capacity) most frequent items as [(item, count, error), ...], largest first."""
+        ranked = sorted(self.counts.items(), key=itemgetter(0))
+        ranked.sort(key=itemgetter(1), reverse=True)
+        k = self.capacity if k is None else k
+        return [(item, count, self.errors.get(item, 0)) for item, count in ranked[:k]]
+
+    def __len__(self):
+        return len(self.counts)
@@ -1,74 +1,238 @@
+import argparse
 import json
 import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import instrumentation
+from json_stream import JSONStreamReader
+
 # --- Configuration ---
 INPUT_FILE = "formatted_chat.json"
 OUTPUT_DIR = "daily_chats"
+MAX_OPEN_FILES = 64                # Day files kept open at once (least recently used are closed)
+BUFFER_BYTES = 32 * 1024 * 1024    # Serialized messages held in memory before flushing
+FLUSH_THREADS = 4                  # Day files written in parallel during a flush
 # ---------------------
 
-def get_filename_from_timestamp(iso_timestamp):
+def get_filename_from_timestamp(iso_timestamp, include_year=False):
     """
-    Parses ISO timestamp and returns a filename string like '22_nov'.
+    Parses ISO timestamp and returns a filename string like '22_nov'
+    (or '22_nov_2023' with include_year, so different years don't collide).
     """
     try:
         dt = datetime.fromisoformat(iso_timestamp)
         # Format: Day_Month (e.g., 22_Nov)
-        date_str = dt.strftime("%d_%b")
+        date_str = dt.strftime("%d_%b_%Y" if include_year else "%d_%b")
         # Convert to lowercase to match request (22_nov)
         return date_str.lower()
     except ValueError:
         return "unknown_date"
 
-def split_chat_by_day():
-    # 1. Load the formatted chat data
+def iter_messages(input_file):
+    """
+    Streams messages from a JSON array (json_cleaner's default output) or
+    from NDJSON (json_cleaner --format ndjson), one at a time. A leading
+    byte order mark is skipped.
+    """
+    with open(input_file, 'r', encoding='utf-8-sig') as f:
+        reader = JSONStreamReader(f)
+        if reader.peek() == "[":
+            yield from reader.elements()
+            return
+        f.seek(0) # NDJSON: one message per line
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+class DayFile:
+    """
+    One day's output file: a JSON array written in appended pieces to a
+    temporary file, which replaces path only once the whole input was read.
+    """
+
+    def __init__(self, path, pretty):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.pretty = pretty
+        self.count = 0
+        self.handle = None
+        self.started = False
+        self.pending = []
+
+    def add(self, msg):
+        if self.pretty:
+            item = json.dumps(msg, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            prefix = "[\n  " if self.count == 0 else ",\n  "
+        else:
+            item = json.dumps(msg, ensure_ascii=False, separators=(",", ":"))
+            prefix = "[" if self.count == 0 else ","
+        self.pending.append(prefix + item)
+        self.count += 1
+        return len(prefix) + len(item)
+
+    def open(self):
+        if self.handle is None:
+            # First open of this run truncates files left over from earlier runs
+            self.handle = open(self.tmp_path, 'a' if self.started else 'w', encoding='utf-8')
+            self.started = True
+
+    def write_pending(self):
+        """Writes buffered messages. Runs on a flush thread; the file must be open."""
+        self.handle.write("".join(self.pending))
+        self.pending = []
+
+    def finish(self):
+        """Writes what is left and the closing bracket."""
+        self.write_pending()
+        self.handle.write(("\n]" if self.pretty else "]") if self.count else "[]")
+        self.close()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def discard(self):
+        """Closes and deletes the temporary file; path is left as it was."""
+        self.close()
+        self.pending = []
+        if self.started:
+            try:
+                os.remove(self.tmp_path)
+            except FileNotFoundError:
+                pass
+
+class DayWriterPool:
+    """
+    Buffers messages per day and flushes them to their files on a thread
+    pool. At most max_open files are open at a time (least recently used
+    are closed and reopened for appending later), and at most buffer_bytes
+    of serialized messages are held in memory, so memory use doesn't grow
+    with the size of the chat. Nothing replaces the day files until close();
+    abort() deletes what was written instead.
+    """
+
+    def __init__(self, output_dir, pretty=False, max_open=MAX_OPEN_FILES,
+                 buffer_bytes=BUFFER_BYTES, threads=FLUSH_THREADS):
+        self.output_dir = output_dir
+        self.pretty = pretty
+        self.max_open = max(1, max_open)
+        self.buffer_bytes = buffer_bytes
+        self.days = {}
+        self.open_days = OrderedDict() # LRU order: least recently flushed first
+        self.buffered = 0
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads))
+
+    def add(self, day_key, msg):
+        day = self.days.get(day_key)
+        if day is None:
+            day = self.days[day_key] = DayFile(os.path.join(self.output_dir, f"{day_key}.json"), self.pretty)
+        self.buffered += day.add(msg)
+        if self.buffered >= self.buffer_bytes:
+            self.flush()
+
+    def _run(self, days, work):
+        """Opens the given days' files (evicting LRU ones) and runs work(day) for each in parallel."""
+        for start in range(0, len(days), self.max_open):
+            group = days[start:start + self.max_open]
+            keep = set(id(day) for day in group)
+            for day in group:
+                if day.handle is None:
+                    while len(self.open_days) >= self.max_open:
+                        evict_key = next(k for k, d in self.open_days.items() if id(d) not in keep)
+                        self.open_days.pop(evict_key).close()
+                    day.open()
+                self.open_days[day.path] = day
+                self.open_days.move_to_end(day.path)
+            for future in [self.executor.submit(work, day) for day in group]:
+                future.result()
+
+    def flush(self):
+        with instrumentation.stage("split_by_date.flush") as stage:
+            pending = [day for day in self.days.values() if day.pending]
+            self._run(pending, DayFile.write_pending)
+            stage.add(bytes=self.buffered, files=len(pending))
+        self.buffered = 0
+
+    def close(self):
+        """Finishes every day's array and moves the files into place."""
+        with instrumentation.stage("split_by_date.finish") as stage:
+            self._run(list(self.days.values()), DayFile.finish)
+            stage.add(files=len(self.days))
+        self.open_days.clear()
+        for day in self.days.values():
+            os.replace(day.tmp_path, day.path)
+        self.executor.shutdown()
+
+    def abort(self):
+        """Drops the buffered messages and deletes the files written so far."""
+        self.executor.shutdown()
+        self.open_days.clear()
+        for day in self.days.values():
+            day.discard()
+
+def split_chat_by_day(input_file=INPUT_FILE, output_dir=OUTPUT_DIR, include_year=False, pretty=False,
+                      max_open=MAX_OPEN_FILES, buffer_bytes=BUFFER_BYTES, threads=FLUSH_THREADS):
+    """
+    Writes one JSON array per day of the input to output_dir. Day files are
+    only replaced if the whole input could be read.
+    Returns the number of day files written, or None on error.
+    """
+    # 1. Create output directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"Created directory: {output_dir}")
+
+    # 2. Stream the formatted chat data, grouping messages by day
+    pool = DayWriterPool(output_dir, pretty, max_open, buffer_bytes, threads)
+    count = 0
+    skipped = 0
+    done = False
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            messages = json.load(f)
+        # Includes the flushes triggered along the way (also timed on their own)
+        with instrumentation.stage("split_by_date.read_group") as stage:
+            for msg in iter_messages(input_file):
+                timestamp = msg.get("timestamp")
+                if not timestamp:
+                    skipped += 1
+                    continue
+                pool.add(get_filename_from_timestamp(timestamp, include_year), msg)
+                count += 1
+            stage.add(messages=count, rejected_no_timestamp=skipped)
+        # 3. Write what is still buffered, close every day's array and move the files into place
+        pool.close()
+        done = True
     except FileNotFoundError:
-        print(f"Error: Input file '{INPUT_FILE}' not found.")
-        return
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{INPUT_FILE}'.")
-        return
-
-    # 2. Create output directory if it doesn't exist
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-        print(f"Created directory: {OUTPUT_DIR}")
-
-    # 3. Group messages by day
-    # Dictionary structure: { "22_nov": [msg1, msg2], "23_nov": [msg3] }
-    daily_groups = {}
-
-    print(f"Processing {len(messages)} messages...")
-
-    for msg in messages:
-        timestamp = msg.get("timestamp")
-        if not timestamp:
-            continue
-
-        filename_key = get_filename_from_timestamp(timestamp)
-        
-        # If this is the first message for this day, initialize the list
-        if filename_key not in daily_groups:
-            daily_groups[filename_key] = []
-        
-        daily_groups[filename_key].append(msg)
-
-    # 4. Write the grouped messages to files
-    for date_key, day_messages in daily_groups.items():
-        # Construct filename: daily_chats/22_nov.json
-        filename = f"{date_key}.json"
-        filepath = os.path.join(OUTPUT_DIR, filename)
-        
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(day_messages, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error writing {filename}: {e}")
-
-    print(f"Successfully split chat into {len(daily_groups)} files in the '{OUTPUT_DIR}' folder.")
+        print(f"Error: Input file '{input_file}' not found.", file=sys.stderr)
+        return None
+    except json.JSONDecodeError as e:
+        print(f"Error: Could not decode JSON from '{input_file}': {e}. No day files were written.", file=sys.stderr)
+        return None
+    finally:
+        if not done:
+            pool.abort()
+
+    print(f"Processed {count} messages.")
+    print(f"Successfully split chat into {len(pool.days)} files in the '{output_dir}' folder.")
+    return len(pool.days)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a formatted chat into one JSON file per day.")
+    parser.add_argument("-i", "--input", default=INPUT_FILE, help=f"Formatted chat, JSON array or NDJSON (default: '{INPUT_FILE}')")
+    parser.add_argument("-o", "--output-dir", default=OUTPUT_DIR, help=f"Output folder (default: '{OUTPUT_DIR}')")
+    parser.add_argument("--year", action="store_true", help="Include the year in file names (22_nov_2023.json)")
+    parser.add_argument("--pretty", action="store_true", help="Indent the JSON output")
+    parser.add_argument("--max-open", type=int, default=MAX_OPEN_FILES, help=f"Day files kept open at once (default: {MAX_OPEN_FILES})")
+    parser.add_argument("--buffer-mb", type=float, default=BUFFER_BYTES / 2**20, help="Memory for buffered messages in MiB (default: 32)")
+    parser.add_argument("--threads", type=int, default=FLUSH_THREADS, help=f"Threads writing day files (default: {FLUSH_THREADS})")
+    args = parser.parse_args(argv)
+
+    if split_chat_by_day(args.input, args.output_dir, args.year, args.pretty,
+                         args.max_open, int(args.buffer_mb * 2**20), args.threads) is None:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    split_chat_by_day()
\ No newline at end of file
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+synthetic_chat.py
+
+Deterministic synthetic chats for benchmarks: WhatsApp .txt exports and
+msgstore-style JSON dumps (the input of json_cleaner.py). The same seed
+and size always give byte-identical files, and messages are written as
+they are generated, so 10M-message files don't need the chat in memory.
+
+Usage:
+    python synthetic_chat.py txt chat.txt -n 1000000
+    python synthetic_chat.py json msgstore.json -n 1000000 --seed 7
+"""
+import argparse
+import datetime
+import json
+import random
+
+# --- Configuration ---
+AUTHORS = ["Milind", "𝐎𝐣𝐨𝐮-𝐒𝐚𝐦𝐚✨", "Ravi Kumar", "+91 98765 43210", "Ananya 🌸", "José Ñúñez"]
+START = datetime.datetime(2019, 1, 1, 8, 0)
+CHAT_ID = "916204411717@s.whatsapp.net"
+MEDIA_RATE = 0.06       # "<Media omitted>" lines / media messages
+MULTILINE_RATE = 0.05   # Messages with continuation lines
+SYSTEM_RATE = 0.01      # "X left", "X added Y", ... (not counted as user messages)
+DELETED_RATE = 0.01
+REPLY_RATE = 0.10       # JSON: messages replying to an earlier one
+CAPTION_RATE = 0.3      # JSON: media messages with a caption
+# ---------------------
+
+WORDS = ("hello hi ok okay yes no haha lol good night morning see you tomorrow what where when why "
+         "how are the this that meeting lunch dinner call later today sure thanks please done").split()
+EMOJI = ["😀", "😂", "❤️", "👍", "🙏", "✨", "🎉", "😭"]
+HEADER = ("Messages and calls are end-to-end encrypted. No one outside of this chat, "
+          "including WhatsApp, can read or listen to them. Tap to learn more.")
+
+class TextSource:
+    """Random message bodies from a fixed vocabulary, with some emoji and links."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def sentence(self):
+        rng = self.rng
+        words = rng.choices(WORDS, k=rng.randint(1, 12))
+        roll = rng.random()
+        if roll < 0.15:
+            words.append(rng.choice(EMOJI))
+        elif roll < 0.18:
+            words.append(f"https://example.com/{rng.randint(1, 9999)}")
+        return " ".join(words)
+
+def _minutes(rng):
+    """Minutes to the next message: mostly bursts, sometimes long gaps."""
+    return rng.randint(0, 3) if rng.random() < 0.8 else rng.randint(10, 600)
+
+# --- .txt export ---
+def iter_txt_lines(messages, seed=0, authors=AUTHORS):
+    """Yields the lines of a .txt export with `messages` user messages."""
+    rng = random.Random(seed)
+    text = TextSource(rng)
+    moment = START
+    stamps = {} # minute -> "dd/mm/yyyy, HH:MM", since many messages share a minute
+    yield f"{moment:%d/%m/%Y, %H:%M} - {HEADER}\n"
+    for _ in range(messages):
+        moment += datetime.timedelta(minutes=_minutes(rng))
+        stamp = stamps.get(moment)
+        if stamp is None:
+            if len(stamps) > 1024:
+                stamps.clear()
+            stamp = stamps[moment] = moment.strftime("%d/%m/%Y, %H:%M")
+        author = rng.choice(authors)
+        if rng.random() < SYSTEM_RATE: # In addition to the user message
+            other = rng.choice(authors)
+            yield f"{stamp} - {author} added {other}\n" if rng.random() < 0.5 else f"{stamp} - {author} left\n"
+        roll = rng.random()
+        if roll < MEDIA_RATE:
+            yield f"{stamp} - {author}: <Media omitted>\n"
+        elif roll < MEDIA_RATE + DELETED_RATE:
+            yield f"{stamp} - {author}: This message was deleted\n"
+        elif roll < MEDIA_RATE + DELETED_RATE + MULTILINE_RATE:
+            yield f"{stamp} - {author}: {text.sentence()}\n"
+            for _ in range(rng.randint(1, 3)):
+                yield f"{text.sentence()}, {text.sentence()}\n"
+        else:
+            yield f"{stamp} - {author}: {text.sentence()}\n"
+
+def generate_txt(path, messages, seed=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(iter_txt_lines(messages, seed))
+
+# --- msgstore JSON dump ---
+def iter_msgstore_messages(messages, seed=0):
+    """Yields (message_id, message) like a decrypted msgstore dump, in id order."""
+    rng = random.Random(seed)
+    text = TextSource(rng)
+    timestamp = int(START.replace(tzinfo=datetime.timezone.utc).timestamp())
+    for i in range(messages):
+        timestamp += _minutes(rng) * 60 + rng.randint(0, 59)
+        msg = {"key_id": f"3EB0{i:016X}", "from_me": rng.random() < 0.5, "timestamp": timestamp}
+        if rng.random() < MEDIA_RATE:
+            msg["media"] = True
+            msg["data"] = None
+            msg["caption"] = text.sentence() if rng.random() < CAPTION_RATE else None
+        else:
+            msg["media"] = False
+            msg["data"] = text.sentence()
+        if i and rng.random() < REPLY_RATE:
+            msg["reply"] = f"3EB0{rng.randrange(i):016X}"
+            msg["quoted_data"] = text.sentence() if rng.random() < 0.5 else None
+        yield str(100000 + i), msg
+
+def generate_msgstore_json(path, messages, seed=0):
+    """Writes {"<chat id>": {"name", "type", "messages": {"<id>": {...}}}} one message at a time."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'{{{json.dumps(CHAT_ID)}: {{"name": "Synthetic", "type": "android", "messages": {{')
+        for i, (message_id, msg) in enumerate(iter_msgstore_messages(messages, seed)):
+            f.write(("\n" if i == 0 else ",\n") + f"{json.dumps(message_id)}: {json.dumps(msg, ensure_ascii=False)}")
+        f.write("\n}}}\n")
+
+GENERATORS = {"txt": generate_txt, "json": generate_msgstore_json}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic chat for benchmarks.")
+    parser.add_argument("kind", choices=sorted(GENERATORS), help="txt export or msgstore JSON dump")
+    parser.add_argument("output", help="File to write")
+    parser.add_argument("-n", "--messages", type=int, default=10_000, help="Number of messages (default: 10000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args(argv)
+
+    GENERATORS[args.kind](args.output, args.messages, args.seed)
+    print(f"Wrote {args.messages} messages to '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,13 @@ from pathlib import Path
 import argparse
 import tempfile
 import os
+import re
 import shutil
 import sys
 
+import instrumentation
+from scanner import BLOCK_SIZE, open_mmap
+
 #!/usr/bin/env python3
 """
 txt_cleaner.py
@@ -13,14 +17,160 @@ Remove all lines that contain the token "<media removed>" (case-insensitive)
 from a text file. By default the input file is updated in-place; an output
 path may be provided to write the cleaned content elsewhere.
 
+Several tokens (-t), regular expressions (-p) and presets (--preset) can be
+combined; they are compiled into one matcher and applied in a single pass.
+Removed lines can be saved to a separate file, and several input files are
+cleaned in parallel.
+
 Usage:
     python txt_cleaner.py input.txt
     python txt_cleaner.py input.txt -o cleaned.txt
+    python txt_cleaner.py input.txt --preset media --preset deleted --preset system --removed removed.txt
+    python txt_cleaner.py exports/*.txt -t "<Media omitted>" -p "^.*: null$" --output-dir cleaned -j 4
 """
 
 TOKEN = "<Media omitted>"
+READ_SIZE = 8 * 1024 * 1024 # Characters per block on the text path (non-ASCII tokens or patterns)
+
+# Common clutter in WhatsApp exports: (tokens, regexes). Regexes are matched
+# per line (^ and $ are line boundaries) and shouldn't span line breaks.
+PRESETS = {
+    "media": (["<Media omitted>"], []),
+    "deleted": (["This message was deleted", "You deleted this message"], []),
+    "edited": (["<This message was edited>"], []),
+    "null": ([], [r": null\r?$"]),
+    # Dated lines with no "author:" part, e.g. "01/02/2023, 10:00 - Ravi left"
+    "system": ([], [r"^\d{1,2}/\d{1,2}/\d{2,4}, [^\n-]* - [^:\n]*$"]),
+}
+
+# --- Matcher ---
+class LineMatcher:
+    """
+    Tokens (case-insensitive substrings) and patterns (regular expressions,
+    matched per line) compiled once and applied to whole blocks of lines.
+
+    Tokens are found with plain find() on a lowercased copy of the block:
+    one copy per block rather than per line. Each extra token costs about
+    one memchr-speed pass, where a regex alternation of the same literals
+    runs ~10x slower than a single literal. All patterns are combined into
+    one regex. Blocks are bytes when every token and pattern is ASCII (the
+    file is then searched without decoding), otherwise str.
+    """
+
+    def __init__(self, tokens=(), patterns=()):
+        tokens = sorted({token.lower() for token in tokens if token})
+        # A token containing another token matches a subset of its lines
+        tokens = [t for t in tokens if not any(other != t and other in t for other in tokens)]
+        patterns = list(patterns)
+        if not tokens and not patterns:
+            raise ValueError("Nothing to remove: give at least one token, pattern or preset.")
+        self.text = not all(item.isascii() for item in tokens + patterns)
+        encode = (lambda value: value) if self.text else (lambda value: value.encode("ascii"))
+        self.newline = encode("\n")
+        self.tokens = [encode(token) for token in tokens]
+        regex = "|".join(f"(?:{pattern})" for pattern in patterns)
+        self.regex = re.compile(encode(regex), re.IGNORECASE | re.MULTILINE) if patterns else None
+
+    def line_spans(self, block):
+        """
+        Returns the sorted, non-overlapping (start, end) spans of the lines in
+        block that match, each ending after its newline (or at the end of block).
+        """
+        newline = self.newline
+        size = len(block)
+        spans = []
+        if self.tokens:
+            lowered = block.lower()
+            if len(lowered) != size: # Unicode lowercasing changed lengths; offsets would drift
+                return self._line_spans_by_line(block)
+            for token in self.tokens:
+                position = lowered.find(token)
+                while position != -1:
+                    line_end = lowered.find(newline, position + len(token))
+                    line_end = size if line_end == -1 else line_end + 1
+                    spans.append((lowered.rfind(newline, 0, position) + 1, line_end))
+                    position = lowered.find(token, line_end)
+        if self.regex is not None:
+            search = self.regex.search
+            match = search(block)
+            while match:
+                start, end = match.span()
+                line_end = block.find(newline, max(end, start + 1) - 1) # Matches may span lines
+                line_end = size if line_end == -1 else line_end + 1
+                spans.append((block.rfind(newline, 0, start) + 1, line_end))
+                match = search(block, line_end)
+        if len(self.tokens) + (self.regex is not None) == 1:
+            return spans # One source: already in order and disjoint
+        spans.sort()
+        merged = []
+        for start, end in spans:
+            if merged and start < merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def _line_spans_by_line(self, block):
+        spans = []
+        offset = 0
+        for line in block.splitlines(keepends=True):
+            lowered = line.lower()
+            if any(token in lowered for token in self.tokens) or (self.regex is not None and self.regex.search(line)):
+                spans.append((offset, offset + len(line)))
+            offset += len(line)
+        return spans
+
+def build_matcher(tokens=(), patterns=()):
+    """Compiles tokens and regex patterns into one LineMatcher."""
+    return LineMatcher(tokens, patterns)
+
+def _remove_matching_lines(block, matcher, dst, removed_dst=None):
+    """
+    Writes block to dst without the lines that match, and those lines to
+    removed_dst. Returns the number of lines removed.
+    """
+    spans = matcher.line_spans(block)
+    kept_from = 0
+    for start, end in spans:
+        dst.write(block[kept_from:start])
+        if removed_dst is not None:
+            removed_dst.write(block[start:end])
+        kept_from = end
+    dst.write(block[kept_from:])
+    removed = sum(block.count(matcher.newline, start, end) for start, end in spans)
+    if spans and spans[-1][1] == len(block) and not block.endswith(matcher.newline):
+        removed += 1 # Last line without a line break
+    return removed
+
+def _iter_byte_blocks(buf, block_size=BLOCK_SIZE):
+    """Copies a mapped file out in blocks that end on a line break."""
+    position = 0
+    while position < len(buf):
+        block_end = min(len(buf), position + block_size)
+        if block_end < len(buf):
+            newline = buf.find(b"\n", block_end - 1)
+            block_end = len(buf) if newline == -1 else newline + 1
+        yield buf[position:block_end]
+        position = block_end
 
-def clean_file(input_path: Path, output_path: Path | None = None, token: str = TOKEN):
+def _iter_text_blocks(src, read_size=READ_SIZE):
+    """Reads a text file in blocks that end on a line break."""
+    while True:
+        block = src.read(read_size)
+        if not block:
+            return
+        if not block.endswith("\n"):
+            block += src.readline()
+        yield block
+
+# --- Cleaning ---
+def clean_file(input_path: Path, output_path: Path | None = None, token: str = TOKEN,
+               matcher=None, removed_path: Path | None = None):
+    """
+    Removes every line matching `matcher` (see build_matcher; default: lines
+    containing `token`). Lines that were removed are written to removed_path
+    if given. Returns the number of lines removed.
+    """
     input_path = input_path.expanduser().resolve()
     if not input_path.is_file():
         raise FileNotFoundError(f"Input file not found: {input_path}")
@@ -35,31 +185,117 @@ def clean_file(input_path: Path, output_path: Path | None = None, token: str = T
         tmp.close()
         output_path = tmp_path
 
-    token_lower = token.lower()
-    with input_path.open("r", encoding="utf-8", errors="replace", newline="") as src, \
-         output_path.open("w", encoding="utf-8", newline="") as dst:
-        for line in src:
-            if token_lower in line.lower():
-                continue
-            dst.write(line)
+    matcher = matcher if matcher is not None else build_matcher([token])
+    with instrumentation.stage("txt_cleaner.clean") as stage:
+        removed = 0
+        if not matcher.text:
+            # Search the raw bytes and copy everything between matching lines unchanged
+            with open_mmap(input_path) as src, output_path.open("wb") as dst, \
+                 (removed_path.open("wb") if removed_path else _no_file()) as removed_dst:
+                for block in _iter_byte_blocks(src):
+                    removed += _remove_matching_lines(block, matcher, dst, removed_dst)
+        else:
+            with input_path.open("r", encoding="utf-8", errors="replace", newline="") as src, \
+                 output_path.open("w", encoding="utf-8", newline="") as dst, \
+                 (removed_path.open("w", encoding="utf-8", newline="") if removed_path else _no_file()) as removed_dst:
+                for block in _iter_text_blocks(src):
+                    removed += _remove_matching_lines(block, matcher, dst, removed_dst)
+        stage.add(bytes=input_path.stat().st_size, lines_removed=removed)
 
     if tmp_path:
         # replace original file atomically
         shutil.copystat(input_path, tmp_path)  # preserve permission/time where possible
         os.replace(str(tmp_path), str(input_path))
+    return removed
+
+def _no_file():
+    import contextlib
+    return contextlib.nullcontext(None)
+
+def clean_files(jobs, matcher, workers=None):
+    """
+    Cleans several files in a process pool. jobs is a list of
+    (input_path, output_path or None, removed_path or None).
+    Yields (input_path, lines removed or the exception) as files finish.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(clean_file, input_path, output_path, TOKEN, matcher, removed_path): input_path
+                   for input_path, output_path, removed_path in jobs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
 
 def main(argv=None):
-    parser = argparse.ArgumentParser(description="Remove lines containing '<media removed>' from a text file.")
-    parser.add_argument("input", help="Path to input .txt file")
-    parser.add_argument("-o", "--output", help="Optional output path. If omitted, input file is updated in-place")
-    parser.add_argument("-t", "--token", default=TOKEN, help="Token to remove lines containing (default: '<media removed>')")
+    parser = argparse.ArgumentParser(description="Remove lines containing '<media removed>' (or other tokens and patterns) from text files.")
+    parser.add_argument("input", nargs="+", help="Path to input .txt file(s)")
+    parser.add_argument("-o", "--output", help="Optional output path (one input only). If omitted, input file is updated in-place")
+    parser.add_argument("--output-dir", help="Write cleaned files to this folder instead of in place")
+    parser.add_argument("-t", "--token", action="append", help="Token to remove lines containing, repeatable (default: '<media removed>')")
+    parser.add_argument("-p", "--pattern", action="append", default=[], help="Regular expression to remove matching lines, repeatable")
+    parser.add_argument("--preset", action="append", default=[], choices=sorted(PRESETS), help="Built-in tokens/patterns, repeatable")
+    parser.add_argument("--removed", help="Save removed lines to this file (one input only)")
+    parser.add_argument("--save-removed", action="store_true", help="Save each file's removed lines next to its output as <name>.removed.txt")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="Files cleaned in parallel (0: one per CPU, default: 0)")
     args = parser.parse_args(argv)
 
+    if len(args.input) > 1 and (args.output or args.removed):
+        print("Error: -o and --removed take a single input; use --output-dir / --save-removed.", file=sys.stderr)
+        sys.exit(1)
+
+    tokens = list(args.token or [])
+    patterns = list(args.pattern)
+    for name in args.preset:
+        tokens.extend(PRESETS[name][0])
+        patterns.extend(PRESETS[name][1])
+    if not tokens and not patterns:
+        tokens = [TOKEN]
+
     try:
-        clean_file(Path(args.input), Path(args.output) if args.output else None, token=args.token)
-    except Exception as e:
-        print(f"Error: {e}", file=sys.stderr)
+        matcher = build_matcher(tokens, patterns)
+    except (re.error, ValueError) as e:
+        print(f"Error: Invalid pattern: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    jobs = []
+    for name in args.input:
+        input_path = Path(name)
+        if args.output:
+            output_path = Path(args.output)
+        elif args.output_dir:
+            output_path = Path(args.output_dir) / input_path.name
+        else:
+            output_path = None
+        if args.removed:
+            removed_path = Path(args.removed)
+        elif args.save_removed:
+            target = output_path or input_path
+            removed_path = target.with_name(target.stem + ".removed.txt")
+        else:
+            removed_path = None
+        jobs.append((input_path, output_path, removed_path))
+    if args.output_dir:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    if len(jobs) == 1:
+        try:
+            clean_file(*jobs[0][:2], matcher=matcher, removed_path=jobs[0][2])
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    failed = 0
+    for input_path, result in clean_files(jobs, matcher, args.jobs or None):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"{input_path}: Error: {result}", file=sys.stderr)
+        else:
+            print(f"{input_path}: removed {result} lines")
+    if failed:
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()